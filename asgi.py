@@ -0,0 +1,336 @@
+"""
+Async variant of the read-only pages, for serving many requests at once against a slow
+database. It needs Quart and an async driver (asyncpg, or aiosqlite for SQLite):
+
+    pip install quart hypercorn asyncpg
+    hypercorn asgi:app --bind 0.0.0.0:8112 --workers 2
+
+The pages, URLs and templates are the same as in server.py. Forms and writes stay on
+server.py; put both behind the same proxy and send the GET pages here.
+
+A request holds no thread while it waits for the database. Queries that don't depend on
+each other each check out their own connection and run at the same time (asyncio.gather),
+so a page costs the slowest of its queries instead of their sum.
+"""
+import asyncio
+
+from quart import Quart, jsonify, redirect, render_template, request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, StaticPool
+
+import queries
+import server
+from server import (
+    COMMENTS_PER_REVIEW, MAX_TOP_BOOKS_LIMIT, MAX_TYPEAHEAD_LIMIT, SEARCH_PAGE_SIZE, TOP_BOOKS_LIMIT,
+    TYPEAHEAD_LIMIT, TYPEAHEAD_QUERIES, USER_ACTIVITY_LIMIT, ReviewWithComments, like_prefix, page_args,
+)
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_uri(uri):
+    """
+    The same database URI with the async driver of its dialect.
+    """
+    scheme, rest = uri.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+# server.POOL_CLASSES for an async engine, which needs the asyncio version of QueuePool
+ASYNC_POOL_CLASSES = {"queue": AsyncAdaptedQueuePool, "null": NullPool, "static": StaticPool}
+
+
+def engine_options(uri):
+    """
+    The engine settings of server.py (BOOKHUB_* environment variables) for the async engine,
+    chosen the same way as in server.create_db_engine().
+    """
+    pool_class = server.pool_class_for(uri, server.POOL_CLASS)
+    options = {"poolclass": ASYNC_POOL_CLASSES[pool_class], "pool_pre_ping": server.POOL_PRE_PING,
+               "echo": server.ECHO}
+    if pool_class == "queue":
+        options.update(pool_size=server.POOL_SIZE, max_overflow=server.MAX_OVERFLOW,
+                       pool_timeout=server.POOL_TIMEOUT, pool_recycle=server.POOL_RECYCLE)
+    if server.ISOLATION_LEVEL:
+        options["isolation_level"] = server.ISOLATION_LEVEL
+
+    connect_args = {}
+    if uri.startswith("postgresql+asyncpg"):
+        # room for every statement in queries.py in asyncpg's per-connection prepared statement cache
+        connect_args["prepared_statement_cache_size"] = max(100, 2 * len(queries.registry))
+        if server.STATEMENT_TIMEOUT:
+            connect_args["server_settings"] = {"statement_timeout": str(server.STATEMENT_TIMEOUT)}
+    options["connect_args"] = connect_args
+    return options
+
+
+# No connection is made until the first request, same as server.py.
+ASYNC_URI = async_uri(server.DATABASEURI)
+engine = create_async_engine(ASYNC_URI, **engine_options(ASYNC_URI))
+if ASYNC_URI.startswith("sqlite"):
+    event.listen(engine.sync_engine, "connect", server.sqlite_pragmas)
+
+app = Quart(__name__, template_folder=server.tmpl_dir)
+# the template globals of server.py (the pre-rendered navbar, fingerprinted static URLs)
+app.jinja_env.globals.update(navbar=server.navbar, static_url=server.static_url)
+
+
+@app.after_serving
+async def close_engine():
+    await engine.dispose()
+
+
+async def fetch(query, params=None):
+    """
+    Runs query on a connection of its own and returns all its rows,
+    so several fetch() calls can be gathered.
+    """
+    async with engine.connect() as conn:
+        result = await conn.execute(query, params or {})
+        return result.fetchall()
+
+
+async def render_page(template_name, name, first_qry, after_qry, key_of, key_parts=1):
+    """
+    server.render_page() without the streaming mode.
+    """
+    cursor, limit, _ = page_args(key_parts, request.args)
+    limit = min(limit, server.MAX_PAGE_SIZE)
+    qry = first_qry
+    params = {"limit": limit + 1}
+    if cursor is not None:
+        qry = after_qry
+        params.update({f"a{i}": value for i, value in enumerate(cursor)})
+
+    rows = await fetch(qry, params)
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = ",".join(str(value) for value in key_of(rows[-1]))
+    return await render_template(template_name, **{name: rows, "next_after": next_after, "limit": limit})
+
+
+@app.route("/books")
+async def books():
+    try:
+        return await render_page("books.html", "books", queries.BOOKS_FIRST, queries.BOOKS_AFTER,
+                                 lambda book: (book[0],))
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/users")
+async def users():
+    try:
+        return await render_page("users.html", "users", queries.USERS_FIRST, queries.USERS_AFTER,
+                                 lambda user: (user[0],))
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/users/<int:user_id>")
+async def user_activity(user_id):
+    try:
+        users, rows = await asyncio.gather(
+            fetch(queries.USER_PROFILE, {"uid": user_id}),
+            fetch(queries.USER_ACTIVITY, {"uid": user_id, "limit": USER_ACTIVITY_LIMIT}))
+        if not users:
+            return f"Error: no user {user_id}", 404
+        activity = {"review": [], "comment": [], "rating": [], "favorite": []}
+        for row in rows:
+            activity[row.kind].append(row)
+        return await render_template("user_activity.html", user=users[0], reviews=activity["review"],
+                                     comments=activity["comment"], ratings=activity["rating"],
+                                     favorites=activity["favorite"])
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/reviews")
+async def reviews():
+    try:
+        return await render_page("reviews.html", "reviews", queries.REVIEWS_FIRST, queries.REVIEWS_AFTER,
+                                 lambda review: (review[0],))
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/ratings")
+async def ratings():
+    try:
+        return await render_page("ratings.html", "ratings", queries.RATINGS_FIRST, queries.RATINGS_AFTER,
+                                 lambda rating: (rating[0], rating[2]), key_parts=2)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/comments")
+async def comments():
+    try:
+        return await render_page("comments.html", "comments", queries.COMMENTS_FIRST, queries.COMMENTS_AFTER,
+                                 lambda comment: (comment[0],))
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/favorites")
+async def favorites():
+    try:
+        return await render_page("favorites.html", "favorites", queries.FAVORITES_FIRST, queries.FAVORITES_AFTER,
+                                 lambda favorite: (favorite[0], favorite[2]), key_parts=2)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/genres")
+async def genres():
+    try:
+        genres = await fetch(queries.GENRES_LIST)
+        return await render_template("genres.html", genres=genres)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/authors")
+async def authors():
+    try:
+        authors = await fetch(queries.AUTHORS_LIST)
+        return await render_template("authors.html", authors=authors)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/top_books")
+async def top_books():
+    try:
+        genre_id = request.args.get("genre", type=int)
+        min_votes = max(1, request.args.get("min_votes", 1, type=int))
+        limit = max(1, min(request.args.get("limit", TOP_BOOKS_LIMIT, type=int), MAX_TOP_BOOKS_LIMIT))
+        params = {"min_votes": min_votes, "limit": limit}
+        query = queries.TOP_BOOKS
+        if genre_id is not None:
+            query = queries.TOP_BOOKS_IN_GENRE
+            params["genre_id"] = genre_id
+        top_books, genres = await asyncio.gather(fetch(query, params), fetch(queries.GENRE_LOOKUP))
+        return await render_template("top_books.html", top_books=top_books, genres=genres,
+                                     selected_genre=genre_id, min_votes=min_votes)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/reviews_by_genre", methods=["GET", "POST"])
+async def reviews_by_genre():
+    genre_id = (await request.values).get("genre_id", type=int)
+    if genre_id is not None:
+        return redirect(f"/reviews_by_genre/{genre_id}")
+    try:
+        genres = await fetch(queries.GENRE_LOOKUP)
+        return await render_template("reviews_by_genre.html", genres=genres)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+async def genre_page(genre_id, page):
+    # the feeds of server.py, loaded through a sync view of the connection; writes made
+    # through server.py reach them here when a feed expires (GENRE_FEED_TTL)
+    async with engine.connect() as conn:
+        return await conn.run_sync(server.genre_feeds.page, genre_id, page)
+
+
+@app.route("/reviews_by_genre/<int:genre_id>")
+async def genre_reviews(genre_id):
+    page = max(1, request.args.get("page", 1, type=int))
+    try:
+        (reviews, has_next), genres = await asyncio.gather(genre_page(genre_id, page), fetch(queries.GENRE_LOOKUP))
+        return await render_template("reviews_by_genre.html", reviews=reviews, genres=genres,
+                                     selected_genre=genre_id, page=page, has_next=has_next)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/reviews_with_comments")
+async def reviews_with_comments():
+    try:
+        cursor, limit, _ = page_args(1, request.args)
+        limit = min(limit, server.MAX_PAGE_SIZE)
+        rows = await fetch(queries.REVIEWS_WITH_COMMENT_COUNTS,
+                           {"after": cursor[0] if cursor else 0, "limit": limit + 1})
+        next_after = str(rows[limit - 1][0]) if len(rows) > limit else None
+        reviews = [ReviewWithComments(row) for row in rows[:limit]]
+
+        # the comments need the review ids, so this one waits for the first query
+        if reviews:
+            by_id = {review.review_id: review for review in reviews}
+            comments = await fetch(queries.FIRST_COMMENTS_OF_REVIEWS,
+                                   {"ids": list(by_id), "per_review": COMMENTS_PER_REVIEW})
+            for row in comments:
+                by_id[row.reviewid].comments.append(row)
+
+        return await render_template("reviews_with_comments.html", reviews=reviews, next_after=next_after,
+                                     limit=limit)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@app.route("/author_books/<int:author_id>")
+async def author_books(author_id):
+    try:
+        books = await fetch(queries.AUTHOR_BOOKS, {"aid": author_id})
+        return await render_template("author_books.html", books=books)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def search_index(query, limit, offset):
+    # building the index takes a while, so it runs in a thread on the sync engine of server.py
+    with server.engine.connect() as conn:
+        return server.search_index.search(conn, query, limit, offset)
+
+
+@app.route("/search")
+async def search():
+    query = request.args.get("query", "").strip()
+    page = max(1, request.args.get("page", 1, type=int))
+    try:
+        results = []
+        if query:
+            limit = SEARCH_PAGE_SIZE + 1
+            offset = (page - 1) * SEARCH_PAGE_SIZE
+            if engine.dialect.name == "postgresql":
+                params = {"q": query, "pattern": f"%{like_prefix(query)}", "limit": limit, "offset": offset}
+                results = await fetch(queries.SEARCH, params)
+            else:
+                # the in-process index of server.py, off the event loop
+                results = await asyncio.to_thread(search_index, query, limit, offset)
+        return await render_template("search_results.html", query=query, results=results[:SEARCH_PAGE_SIZE],
+                                     page=page, has_next=len(results) > SEARCH_PAGE_SIZE)
+    except Exception as e:
+        return f"Error searching: {e}"
+
+
+async def typeahead(entity):
+    prefix = request.args.get("prefix", "").strip().lower()
+    if not prefix:
+        return jsonify([])
+    limit = max(1, min(request.args.get("limit", TYPEAHEAD_LIMIT, type=int), MAX_TYPEAHEAD_LIMIT))
+    rows = await fetch(TYPEAHEAD_QUERIES[entity], {"prefix": like_prefix(prefix), "limit": limit})
+    return jsonify([{"id": row[0], "label": row[1]} for row in rows])
+
+
+@app.route("/api/books")
+async def api_books():
+    return await typeahead("books")
+
+
+@app.route("/api/users")
+async def api_users():
+    return await typeahead("users")
+
+
+@app.route("/api/authors")
+async def api_authors():
+    return await typeahead("authors")
@@ -0,0 +1,458 @@
+"""
+Benchmark for server.py against a local database filled with synthetic data.
+
+    python bench.py seed sqlite:///bench.sqlite --scale 0.1
+    python bench.py run sqlite:///bench.sqlite --concurrency 16 --duration 30
+
+seed creates the schema (migrations/) and fills it; at --scale 1 that is 1M ratings,
+100k reviews and 500k comments. run drives every route of server.py from --concurrency
+threads, through the Flask test client or, with --url, over HTTP against a running
+server, and prints requests/sec and p50/p95/p99 latency per route. Pass --output
+bench_output.txt to keep the report. Left out are only /another and /login, examples
+from the course template that don't touch the database.
+
+The same seed and scale give the same data, so runs before and after a change compare.
+The write and delete routes change it, though: the deletes remove seeded rows (sampled
+from the database when the run starts, so they hit real ones) from the upper half of
+each table, so seed again, or pass --reads-only, when runs have to see exactly the same
+data.
+"""
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import click
+
+SIZES = {
+    "users": 20000,
+    "authors": 10000,
+    "genres": 40,
+    "books": 100000,
+    "reviews": 100000,
+    "comments": 500000,
+    "ratings": 1000000,
+    "favorites": 100000,
+}
+CHUNK_SIZE = 10000
+DELETE_SAMPLE = 1000
+# the rows the delete routes need: table -> (id column, the table the ids number), read
+# with the user who may delete the row
+DELETE_TARGETS = {
+    "reviews": ("reviewid", "reviews"),
+    "comments": ("commentid", "comments"),
+    "ratings": ("bookid", "books"),
+    "favorites": ("bookid", "books"),
+}
+API_RESOURCES = ("books", "authors", "reviews", "comments", "ratings", "favorites")
+# one view serves the items of every resource; reviews and comments are left out because
+# deleting a book takes its reviews with it, whatever their ids
+API_ITEMS = ("books", "authors")
+WORDS = ("night", "garden", "river", "shadow", "empire", "winter", "glass", "house", "storm", "letters",
+         "queen", "silent", "machine", "ocean", "last", "city", "wolf", "dream", "road", "fire")
+
+
+def load_server(uri):
+    """
+    Imports server.py pointed at uri.
+    """
+    os.environ["BOOKHUB_DATABASE_URI"] = uri
+    import server
+
+    return server
+
+
+def title(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title() + f" {n}"
+
+
+def rows_of(kind, sizes, rng):
+    """
+    Yields the rows of one table. Ids are given explicitly so the other tables can refer to them.
+    """
+    users, books = sizes["users"], sizes["books"]
+    if kind == "users":
+        for i in range(1, users + 1):
+            yield {"userid": i, "username": f"reader{i}", "user_email": f"reader{i}@example.com",
+                   "preferences": rng.choice(WORDS)}
+    elif kind == "authors":
+        for i in range(1, sizes["authors"] + 1):
+            yield {"authorid": i, "name": f"{rng.choice(WORDS).title()} Author {i}",
+                   "year_of_birth": rng.randint(1850, 2000), "nationality": rng.choice(("US", "UK", "FR", "IN", "JP"))}
+    elif kind == "genres":
+        for i in range(1, sizes["genres"] + 1):
+            yield {"genreid": i, "genrename": f"Genre {i}"}
+    elif kind == "books":
+        for i in range(1, books + 1):
+            yield {"bookid": i, "book_title": title(rng, i), "isbn": f"978{i:010d}",
+                   "combined_rating": round(rng.uniform(1, 5), 2)}
+    elif kind == "book_authors":
+        for i in range(1, books + 1):
+            yield {"bookid": i, "authorid": rng.randint(1, sizes["authors"])}
+    elif kind == "bookgenres":
+        for i in range(1, books + 1):
+            yield {"bookid": i, "genreid": rng.randint(1, sizes["genres"])}
+    elif kind == "reviews":
+        for i in range(1, sizes["reviews"] + 1):
+            yield {"reviewid": i, "userid": rng.randint(1, users), "bookid": rng.randint(1, books),
+                   "com_content": f"Review {i}: " + " ".join(rng.choices(WORDS, k=12)),
+                   "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1.6e9 + i * 60))}
+    elif kind == "comments":
+        for i in range(1, sizes["comments"] + 1):
+            yield {"commentid": i, "userid": rng.randint(1, users), "reviewid": rng.randint(1, sizes["reviews"]),
+                   "com_content": f"Comment {i}: " + " ".join(rng.choices(WORDS, k=6)),
+                   "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1.6e9 + i * 20))}
+    elif kind in ("ratings", "favorites"):
+        # (user, book) pairs must be unique: user i % users gets consecutive, shifted books
+        for i in range(min(sizes[kind], users * books)):
+            user = i % users
+            book = (i // users + user * 7919) % books
+            row = {"userid": user + 1, "bookid": book + 1}
+            if kind == "ratings":
+                row["score"] = rng.randint(1, 5)
+            yield row
+
+
+SEED_ORDER = ("users", "authors", "genres", "books", "book_authors", "bookgenres",
+              "reviews", "comments", "ratings", "favorites")
+
+
+def seed(engine, sizes, rng, report=print):
+    import bulk_import
+    import migrate
+    from sqlalchemy import column, insert, table, text
+
+    migrate.run_migrations(engine, report=report)
+    with engine.connect() as conn:
+        for kind in SEED_ORDER:
+            start = time.perf_counter()
+            tbl = None
+            count = 0
+            for chunk in bulk_import.chunked(rows_of(kind, sizes, rng), CHUNK_SIZE):
+                if tbl is None:
+                    tbl = table(kind, *(column(name) for name in chunk[0]))
+                conn.execute(insert(tbl), chunk)
+                count += len(chunk)
+            conn.commit()
+            report(f"{kind}: {count} rows in {time.perf_counter() - start:.1f}s")
+
+        if conn.dialect.name == "postgresql":
+            # the ids were given explicitly, move the sequences past them
+            for tbl, id_col in (("users", "userid"), ("authors", "authorid"), ("genres", "genreid"),
+                                ("books", "bookid"), ("reviews", "reviewid"), ("comments", "commentid")):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{tbl}', '{id_col}'), "
+                                  f"(SELECT MAX({id_col}) FROM {tbl}))"))
+            conn.execute(text("ANALYZE"))
+        conn.commit()
+
+
+def kept_ids(count):
+    """
+    The delete routes remove seeded rows from the upper half of each id range and the
+    write routes refer to the lower half, ids 1 to kept_ids(count), so they find their rows.
+    """
+    return (count + 1) // 2
+
+
+def sample_rows(engine, sizes):
+    """
+    {table: [(id, user id)]}, DELETE_SAMPLE random rows of each of DELETE_TARGETS whose
+    id is past kept_ids().
+    """
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        return {tbl: [tuple(row) for row in conn.execute(
+                    text(f"SELECT {id_col}, userid FROM {tbl} WHERE {id_col} > :kept ORDER BY random() LIMIT :n"),
+                    {"kept": kept_ids(sizes[kind]), "n": DELETE_SAMPLE})]
+                for tbl, (id_col, kind) in DELETE_TARGETS.items()}
+
+
+def route_mix(sizes, rows):
+    """
+    The requests a run makes: [(route label, weight, make(rng) -> (method, path, form or None))].
+    A form is a dict, or a list to send as JSON. rows is sample_rows(), for the deletes.
+    Reads outweigh writes, as on the real site.
+    """
+    users, books, reviews = sizes["users"], sizes["books"], sizes["reviews"]
+
+    def get(path):
+        return lambda rng: ("GET", path(rng) if callable(path) else path, None)
+
+    def post(path, form):
+        return lambda rng: ("POST", path(rng) if callable(path) else path, form(rng))
+
+    def kept(rng, kind):
+        return rng.randint(1, kept_ids(sizes[kind]))
+
+    def doomed(rng, kind):
+        # with a single row there is nothing to delete, and the id past it finds nothing
+        first = kept_ids(sizes[kind]) + 1
+        return rng.randint(first, max(first, sizes[kind]))
+
+    def delete(route, tbl):
+        # a row deleted earlier in the run is deleted again, which finds nothing
+        def make(rng):
+            row_id, user_id = rng.choice(rows[tbl]) if rows[tbl] else (1, 1)
+            return "POST", f"/{route}/{row_id}", {"user_id": user_id}
+        return make
+
+    def ratings(rng):
+        return [{"user_id": rng.randint(1, users), "book_id": kept(rng, "books"), "score": rng.randint(1, 5)}
+                for _ in range(20)]
+
+    return [
+        ("/", 2, get("/")),
+        ("/books", 6, get("/books")),
+        ("/books?after", 6, get(lambda rng: f"/books?after={rng.randint(1, books)}")),
+        ("/users", 3, get(lambda rng: f"/users?after={rng.randint(1, users)}")),
+        ("/reviews", 6, get("/reviews")),
+        ("/reviews?after", 4, get(lambda rng: f"/reviews?after={rng.randint(1, reviews)}")),
+        ("/ratings", 3, get(lambda rng: f"/ratings?after={rng.randint(1, users)},{rng.randint(1, books)}")),
+        ("/comments", 3, get("/comments")),
+        ("/favorites", 2, get("/favorites")),
+        ("/genres", 3, get("/genres")),
+        ("/authors", 2, get("/authors")),
+        ("/top_books", 6, get("/top_books")),
+        ("/top_books?genre", 4, get(lambda rng: f"/top_books?genre={rng.randint(1, sizes['genres'])}&min_votes=3")),
+        ("/search", 8, get(lambda rng: "/search?" + urllib.parse.urlencode({"query": rng.choice(WORDS)}))),
+        ("/reviews_with_comments", 4, get(lambda rng: f"/reviews_with_comments?after={rng.randint(0, reviews)}")),
+        ("/reviews/<id>/comments", 3, get(lambda rng: f"/reviews/{rng.randint(1, reviews)}/comments")),
+        ("/author_books/<id>", 4, get(lambda rng: f"/author_books/{rng.randint(1, sizes['authors'])}")),
+        ("/api/books", 6, get(lambda rng: f"/api/books?prefix={rng.choice(WORDS)[:3]}")),
+        ("/api/reviews", 2, get(lambda rng: f"/api/reviews?book={rng.randint(1, books)}")),
+        ("/api/v1/books?ids", 2, get(lambda rng: "/api/v1/books?ids=" + ",".join(
+            str(rng.randint(1, books)) for _ in range(20)))),
+        ("/reviews_by_genre/<id>", 2, get(lambda rng: f"/reviews_by_genre/{rng.randint(1, sizes['genres'])}"
+                                             f"?page={rng.randint(1, 3)}")),
+        ("/users/<id>", 3, get(lambda rng: f"/users/{rng.randint(1, users)}")),
+        ("POST /rate_book", 3, post("/rate_book", lambda rng: {
+            "user_id": rng.randint(1, users), "book_id": kept(rng, "books"), "score": rng.randint(1, 5)})),
+        ("POST /add_review", 1, post("/add_review", lambda rng: {
+            "user_id": rng.randint(1, users), "book_id": kept(rng, "books"), "content": "bench review"})),
+        ("POST /add_comment", 1, post("/add_comment", lambda rng: {
+            "user_id": rng.randint(1, users), "review_id": kept(rng, "reviews"), "com_content": "bench comment"})),
+        ("POST /add_favorite", 1, post("/add_favorite", lambda rng: {
+            "user_id": rng.randint(1, users), "book_id": kept(rng, "books")})),
+        ("POST /add_user", 1, post("/add_user", lambda rng: {
+            "username": f"bench{rng.randrange(10 ** 9)}", "email": "bench@example.com",
+            "preferences": rng.choice(WORDS)})),
+        ("POST /add_book", 1, post("/add_book", lambda rng: {
+            "book_title": title(rng, "bench"), "isbn": f"979{rng.randrange(10 ** 10):010d}",
+            "author_id": kept(rng, "authors"), "genre_id": kept(rng, "genres"),
+            "combined_rating": round(rng.uniform(1, 5), 2)})),
+        ("POST /add_genre", 1, post("/add_genre", lambda rng: {"genre_name": f"Bench {rng.randrange(10 ** 9)}"})),
+        ("POST /add_author", 1, post("/add_author", lambda rng: {
+            "name": f"Bench Author {rng.randrange(10 ** 9)}", "year_of_birth": rng.randint(1850, 2000),
+            "nationality": "US"})),
+        ("POST /reviews_by_genre", 1, post("/reviews_by_genre", lambda rng: {
+            "genre_id": rng.randint(1, sizes["genres"])})),
+        ("POST /api/v1/ratings", 1, post("/api/v1/ratings", ratings)),
+        ("POST /delete_book/<id>", 1, post(lambda rng: f"/delete_book/{doomed(rng, 'books')}", lambda rng: {})),
+        ("POST /delete_author/<id>", 1, post(lambda rng: f"/delete_author/{doomed(rng, 'authors')}",
+                                             lambda rng: {})),
+        ("POST /delete_genre/<id>", 1, post(lambda rng: f"/delete_genre/{doomed(rng, 'genres')}",
+                                            lambda rng: {})),
+        ("POST /delete_review/<id>", 1, delete("delete_review", "reviews")),
+        ("POST /delete_comment/<id>", 1, delete("delete_comment", "comments")),
+        ("POST /delete_rating/<id>", 1, delete("delete_rating", "ratings")),
+        ("POST /delete_favorite/<id>", 1, delete("delete_favorite", "favorites")),
+        # the form pages
+        ("/add_book", 1, get("/add_book")),
+        ("/add_user", 1, get("/add_user")),
+        ("/add_review", 1, get("/add_review")),
+        ("/rate_book", 1, get("/rate_book")),
+        ("/add_comment", 1, get("/add_comment")),
+        ("/add_favorite", 1, get("/add_favorite")),
+        ("/add_genre", 1, get("/add_genre")),
+        ("/add_author", 1, get("/add_author")),
+        ("/reviews_by_genre", 1, get("/reviews_by_genre")),
+        # JSON and monitoring
+        ("/api/users", 2, get(lambda rng: f"/api/users?prefix=reader{rng.randint(1, 9)}")),
+        ("/api/authors", 2, get(lambda rng: f"/api/authors?prefix={rng.choice(WORDS)[:3]}")),
+        ("/api/v1/<resource>", 2, get(lambda rng: f"/api/v1/{rng.choice(API_RESOURCES)}")),
+        ("/api/v1/<resource>/<id>", 2, get(lambda rng: (lambda name: f"/api/v1/{name}/{kept(rng, name)}")(
+            rng.choice(API_ITEMS)))),
+        ("/recommendations/<id>", 2, get(lambda rng: f"/recommendations/{rng.randint(1, users)}")),
+        ("/metrics", 1, get("/metrics")),
+        ("/pool_stats", 1, get("/pool_stats")),
+    ]
+
+
+def test_client_sender(app):
+    client = app.test_client()
+
+    def send(method, path, form):
+        if isinstance(form, list):
+            response = client.open(path, method=method, json=form)
+        else:
+            response = client.open(path, method=method, data=form)
+        # the routes answer errors with a 200 "Error: ..." page
+        return response.status_code < 400 and not response.get_data().startswith(b"Error")
+
+    return send
+
+
+def http_sender(base_url):
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    opener = urllib.request.build_opener(NoRedirect)
+
+    def send(method, path, form):
+        headers = {}
+        if isinstance(form, list):
+            data = json.dumps(form).encode()
+            headers["Content-Type"] = "application/json"
+        else:
+            data = urllib.parse.urlencode(form).encode() if form is not None else None
+        try:
+            request = urllib.request.Request(base_url + path, data=data, headers=headers, method=method)
+            with opener.open(request) as response:
+                return not response.read(5).startswith(b"Error")
+        except urllib.error.HTTPError as e:
+            return e.code < 400
+
+    return send
+
+
+def drive(make_sender, mix, concurrency, duration, seed_value):
+    """
+    Sends requests from concurrency threads for duration seconds.
+    Returns ({route: [seconds, ...]}, {route: errors}, elapsed seconds).
+    """
+    labels = [label for label, _, _ in mix]
+    weights = [weight for _, weight, _ in mix]
+    makers = {label: make for label, _, make in mix}
+    latencies = {label: [] for label in labels}
+    errors = {label: 0 for label in labels}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(n):
+        rng = random.Random(seed_value * 1000 + n)
+        send = make_sender()
+        mine = {label: [] for label in labels}
+        failed = {label: 0 for label in labels}
+        while time.perf_counter() < deadline:
+            label = rng.choices(labels, weights)[0]
+            method, path, form = makers[label](rng)
+            start = time.perf_counter()
+            try:
+                ok = send(method, path, form)
+            except Exception:
+                ok = False
+            mine[label].append(time.perf_counter() - start)
+            if not ok:
+                failed[label] += 1
+        with lock:
+            for label in labels:
+                latencies[label] += mine[label]
+                errors[label] += failed[label]
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def report_lines(latencies, errors, elapsed):
+    lines = [f"{'route':<28} {'count':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}"]
+    everything = []
+    for label, values in latencies.items():
+        values.sort()
+        everything += values
+        lines.append(f"{label:<28} {len(values):>7} {len(values) / elapsed:>8.1f} "
+                     f"{percentile(values, 50) * 1000:>8.1f} {percentile(values, 95) * 1000:>8.1f} "
+                     f"{percentile(values, 99) * 1000:>8.1f} {errors[label]:>6}")
+    everything.sort()
+    lines.append(f"{'all':<28} {len(everything):>7} {len(everything) / elapsed:>8.1f} "
+                 f"{percentile(everything, 50) * 1000:>8.1f} {percentile(everything, 95) * 1000:>8.1f} "
+                 f"{percentile(everything, 99) * 1000:>8.1f} {sum(errors.values()):>6}")
+    if everything:
+        lines.append(f"mean {statistics.fmean(everything) * 1000:.1f} ms over {elapsed:.1f}s")
+    return lines
+
+
+def scaled_sizes(scale):
+    return {kind: max(1, int(count * scale)) for kind, count in SIZES.items()}
+
+
+@click.group()
+def cli():
+    """
+    Seeds a benchmark database and load-tests server.py against it.
+    """
+
+
+@cli.command("seed")
+@click.argument("URI")
+@click.option("--scale", default=1.0, show_default=True, help="Multiplies every table size (1.0 = 1M ratings).")
+@click.option("--seed", "seed_value", default=1, show_default=True, help="Random seed of the generated data.")
+def seed_command(uri, scale, seed_value):
+    """
+    Creates the schema in an empty database at URI and fills it with synthetic data.
+    """
+    server = load_server(uri)
+    sizes = scaled_sizes(scale)
+    click.echo(", ".join(f"{kind} {count}" for kind, count in sizes.items()))
+    seed(server.engine, sizes, random.Random(seed_value), report=click.echo)
+
+
+@cli.command("run")
+@click.argument("URI")
+@click.option("--scale", default=1.0, show_default=True, help="The --scale the database was seeded with.")
+@click.option("--concurrency", default=8, show_default=True, help="Threads sending requests.")
+@click.option("--duration", default=30.0, show_default=True, help="Seconds to run.")
+@click.option("--url", default=None, help="Send HTTP requests to a running server instead of the test client.")
+@click.option("--no-page-cache", is_flag=True, help="Disable the rendered page cache, measure the database path.")
+@click.option("--reads-only", is_flag=True, help="Skip the POST routes.")
+@click.option("--seed", "seed_value", default=1, show_default=True, help="Random seed of the request mix.")
+@click.option("--output", default=None, type=click.Path(dir_okay=False), help="Also write the report to this file.")
+def run_command(uri, scale, concurrency, duration, url, no_page_cache, reads_only, seed_value, output):
+    """
+    Runs the request mix against the database at URI and reports latency per route.
+    """
+    server = load_server(uri)
+    # the rows the deletes hit, read before the clock starts
+    sizes = scaled_sizes(scale)
+    rows = dict.fromkeys(DELETE_TARGETS, []) if reads_only else sample_rows(server.engine, sizes)
+    mix = route_mix(sizes, rows)
+    if reads_only:
+        mix = [entry for entry in mix if not entry[0].startswith("POST ")]
+
+    if url:
+        make_sender = lambda: http_sender(url.rstrip("/"))
+    else:
+        server.configure_engine(pool_size=concurrency, max_overflow=0, pool_timeout=server.POOL_TIMEOUT,
+                                pool_recycle=server.POOL_RECYCLE, pool_pre_ping=False)
+        if no_page_cache:
+            server.page_cache.max_bytes = 0
+        make_sender = lambda: test_client_sender(server.app)
+
+    click.echo(f"{concurrency} threads for {duration:.0f}s against {url or uri}")
+    latencies, errors, elapsed = drive(make_sender, mix, concurrency, duration, seed_value)
+    lines = report_lines(latencies, errors, elapsed)
+    click.echo("\n".join(lines))
+    if output:
+        with open(output, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,287 @@
+"""
+Bulk loading of books, authors, genres and ratings from CSV or JSONL files.
+Run it through the server's command line:
+
+    python server.py import books catalog.csv
+    python server.py import ratings ratings.jsonl --chunk-size 10000
+
+Rows are streamed from the file, so memory use does not depend on its size. They are
+written in chunks: each chunk is one transaction with one batched INSERT per table, and
+author and genre names are resolved to ids with one query per chunk instead of per row.
+
+Columns (CSV header or JSON keys):
+    books:    book_title, isbn, combined_rating, authors, genres
+              authors and genres are names separated by "|"; missing ones are created.
+              Books are matched on isbn, so ones already in the database are skipped
+              and a nightly catalog can be loaded again safely.
+    authors:  name, year_of_birth, nationality
+    genres:   genrename
+    ratings:  userid, bookid (or isbn), score; a user's existing rating is replaced.
+              Rows that aren't numbers or name a user or book that doesn't exist are
+              skipped, like books whose names can't be resolved.
+"""
+import csv
+import json
+import time
+
+from sqlalchemy import bindparam, column, insert, table, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+CHUNK_SIZE = 5000
+NAME_SEPARATOR = "|"
+
+books_table = table("books", column("book_title"), column("isbn"), column("combined_rating"))
+authors_table = table("authors", column("authorid"), column("name"), column("year_of_birth"), column("nationality"))
+genres_table = table("genres", column("genreid"), column("genrename"))
+book_authors_table = table("book_authors", column("bookid"), column("authorid"))
+bookgenres_table = table("bookgenres", column("bookid"), column("genreid"))
+ratings_table = table("ratings", column("userid"), column("bookid"), column("score"))
+
+
+def read_rows(path, fmt=None):
+    """
+    Yields the rows of a CSV or JSONL file as dicts, one at a time.
+    The format comes from the file extension unless fmt is given.
+    """
+    if fmt is None:
+        fmt = "jsonl" if path.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def upsert(conn, tbl):
+    """
+    INSERT construct for tbl that supports ON CONFLICT on this database.
+    Executed with a list of rows, SQLAlchemy sends it as multi-row VALUES batches.
+    """
+    if conn.dialect.name == "postgresql":
+        return postgresql.insert(tbl)
+    if conn.dialect.name == "sqlite":
+        return sqlite.insert(tbl)
+    return insert(tbl)
+
+
+def clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def split_names(value):
+    if isinstance(value, list):
+        names = value
+    else:
+        names = (value or "").split(NAME_SEPARATOR)
+    return [name.strip() for name in names if name and name.strip()]
+
+
+def ids_by_name(conn, tbl, id_col, name_col, names):
+    """
+    Returns {name: id} for the names that match a row, compared with the database's own
+    lower() on both sides: SQLite's only folds ASCII, so lowering the names in Python
+    would miss "Émile Zola".
+    """
+    values = ", ".join(f"(:n{i})" for i in range(len(names)))
+    qry = text(f"""
+        WITH wanted (name) AS (VALUES {values})
+        SELECT wanted.name, MIN(t.{id_col})
+        FROM wanted
+        JOIN {tbl.name} t ON lower(t.{name_col}) = lower(wanted.name)
+        GROUP BY wanted.name
+    """)
+    return dict(conn.execute(qry, {f"n{i}": name for i, name in enumerate(names)}).fetchall())
+
+
+def resolve_names(conn, tbl, id_col, name_col, names):
+    """
+    Returns {name.lower(): id} for the given names, creating the ones that don't exist.
+    One SELECT, at most one batched INSERT and one more SELECT, whatever the number of names.
+    A name that still can't be found is left out.
+    """
+    wanted = {}
+    for name in names:
+        wanted.setdefault(name.lower(), name)
+    if not wanted:
+        return {}
+
+    found = ids_by_name(conn, tbl, id_col, name_col, list(wanted.values()))
+    missing = [name for name in wanted.values() if name not in found]
+    if missing:
+        conn.execute(upsert(conn, tbl).on_conflict_do_nothing(), [{name_col: name} for name in missing])
+        found.update(ids_by_name(conn, tbl, id_col, name_col, missing))
+    return {key: found[name] for key, name in wanted.items() if name in found}
+
+
+def existing_ids(conn, tbl, id_col, ids):
+    """
+    The ones of ids that are rows of tbl.
+    """
+    if not ids:
+        return set()
+    qry = text(f"SELECT {id_col} FROM {tbl} WHERE {id_col} IN :ids").bindparams(bindparam("ids", expanding=True))
+    return {row[0] for row in conn.execute(qry, {"ids": list(ids)})}
+
+
+def book_ids_by_isbn(conn, isbns):
+    if not isbns:
+        return {}
+    qry = text("""
+        SELECT isbn, MAX(bookid) FROM books WHERE isbn IN :isbns GROUP BY isbn
+    """).bindparams(bindparam("isbns", expanding=True))
+    return dict(conn.execute(qry, {"isbns": list(isbns)}).fetchall())
+
+
+def import_books(conn, rows):
+    books = {}
+    skipped = 0
+    for row in rows:
+        title, isbn = clean(row.get("book_title")), clean(row.get("isbn"))
+        if not title or not isbn:
+            skipped += 1
+            continue
+        books[isbn] = {
+            "book_title": title,
+            "isbn": isbn,
+            "combined_rating": clean(row.get("combined_rating")),
+            "authors": split_names(row.get("authors")),
+            "genres": split_names(row.get("genres")),
+        }
+
+    existing = book_ids_by_isbn(conn, books)
+    new_books = [book for isbn, book in books.items() if isbn not in existing]
+    skipped += len(books) - len(new_books)
+    if not new_books:
+        return 0, skipped
+
+    author_ids = resolve_names(conn, authors_table, "authorid", "name",
+                               [name for b in new_books for name in b["authors"]])
+    genre_ids = resolve_names(conn, genres_table, "genreid", "genrename",
+                              [name for b in new_books for name in b["genres"]])
+    # a book whose author or genre couldn't be resolved is skipped, not the whole chunk
+    resolved = [b for b in new_books
+                if all(name.lower() in author_ids for name in b["authors"])
+                and all(name.lower() in genre_ids for name in b["genres"])]
+    skipped += len(new_books) - len(resolved)
+    new_books = resolved
+    if not new_books:
+        return 0, skipped
+
+    conn.execute(insert(books_table), [
+        {"book_title": b["book_title"], "isbn": b["isbn"], "combined_rating": b["combined_rating"]}
+        for b in new_books
+    ])
+    book_ids = book_ids_by_isbn(conn, [b["isbn"] for b in new_books])
+
+    # two spellings of one name in a row are one link
+    links = dict.fromkeys((book_ids[b["isbn"]], author_ids[name.lower()])
+                          for b in new_books for name in b["authors"])
+    if links:
+        conn.execute(insert(book_authors_table), [{"bookid": book_id, "authorid": author_id}
+                                                  for book_id, author_id in links])
+    links = dict.fromkeys((book_ids[b["isbn"]], genre_ids[name.lower()])
+                          for b in new_books for name in b["genres"])
+    if links:
+        conn.execute(insert(bookgenres_table), [{"bookid": book_id, "genreid": genre_id}
+                                                for book_id, genre_id in links])
+    return len(new_books), skipped
+
+
+def import_authors(conn, rows):
+    authors = [
+        {"name": clean(row.get("name")), "year_of_birth": clean(row.get("year_of_birth")),
+         "nationality": clean(row.get("nationality"))}
+        for row in rows
+    ]
+    authors = [author for author in authors if author["name"]]
+    # same-named authors are skipped (unique on lower(name)), RETURNING has only the new ones
+    written = insert_new(conn, authors_table, authors, authors_table.c.authorid)
+    return written, len(rows) - written
+
+
+def import_genres(conn, rows):
+    names = [clean(row.get("genrename")) for row in rows]
+    genres = [{"genrename": name} for name in names if name]
+    written = insert_new(conn, genres_table, genres, genres_table.c.genreid)
+    return written, len(rows) - written
+
+
+def insert_new(conn, tbl, rows, id_col):
+    """
+    Inserts the rows that don't conflict with an existing one. Returns how many were inserted.
+    """
+    if not rows:
+        return 0
+    stmt = upsert(conn, tbl).on_conflict_do_nothing().returning(id_col)
+    return len(conn.execute(stmt, rows).fetchall())
+
+
+def import_ratings(conn, rows):
+    isbns = {clean(row.get("isbn")) for row in rows if not clean(row.get("bookid")) and clean(row.get("isbn"))}
+    isbn_ids = book_ids_by_isbn(conn, isbns)
+
+    # one multi-row upsert can't touch the same (userid, bookid) twice, the last one wins
+    ratings = {}
+    for row in rows:
+        user_id, score = clean(row.get("userid")), clean(row.get("score"))
+        book_id = clean(row.get("bookid")) or isbn_ids.get(clean(row.get("isbn")))
+        if not (user_id and book_id and score):
+            continue
+        try:
+            ratings[(int(user_id), int(book_id))] = int(float(score))
+        except (ValueError, OverflowError):
+            continue
+
+    # a rating of a missing user or book would fail the whole chunk
+    users = existing_ids(conn, "users", "userid", {user_id for user_id, _ in ratings})
+    books = existing_ids(conn, "books", "bookid", {book_id for _, book_id in ratings})
+    ratings = {key: score for key, score in ratings.items() if key[0] in users and key[1] in books}
+    if ratings:
+        stmt = upsert(conn, ratings_table)
+        stmt = stmt.on_conflict_do_update(index_elements=["userid", "bookid"], set_={"score": stmt.excluded.score})
+        conn.execute(stmt, [{"userid": u, "bookid": b, "score": s} for (u, b), s in ratings.items()])
+    return len(ratings), len(rows) - len(ratings)
+
+
+IMPORTERS = {
+    "books": import_books,
+    "authors": import_authors,
+    "genres": import_genres,
+    "ratings": import_ratings,
+}
+
+
+def run_import(engine, kind, path, fmt=None, chunk_size=CHUNK_SIZE, report=print):
+    """
+    Loads path into the database, committing every chunk_size rows, and calls report()
+    with a progress line after each chunk. Returns (rows written, rows skipped, seconds).
+    """
+    load = IMPORTERS[kind]
+    written = skipped = 0
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        for chunk in chunked(read_rows(path, fmt), chunk_size):
+            chunk_written, chunk_skipped = load(conn, chunk)
+            conn.commit()
+            written += chunk_written
+            skipped += chunk_skipped
+            elapsed = time.perf_counter() - start
+            report(f"{kind}: {written} written, {skipped} skipped, {written / elapsed:.0f} rows/sec")
+    return written, skipped, time.perf_counter() - start
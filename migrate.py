@@ -0,0 +1,119 @@
+"""
+Schema migrations. Run them through the server's command line:
+
+    python server.py migrate            apply the pending migrations
+    python server.py migrate --status   list applied and pending migrations
+
+Migrations are the files in migrations/ named NNN_description.sql, applied in order of
+NNN. A file named NNN_description.<dialect>.sql (e.g. 003_rating_summary.sqlite.sql)
+replaces the plain one on that database. Each migration runs in its own transaction
+together with the row that records it in schema_migrations, so a failed one leaves
+nothing behind and is tried again next time.
+
+All migrations are written so that running one again is harmless. A database that had
+them applied by hand with psql can simply be migrated; they are recorded as they go.
+"""
+import os
+import re
+import time
+
+from sqlalchemy import text
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+FILE_RE = re.compile(r"^(\d+)_(\w+?)(?:\.(\w+))?\.sql$")
+
+# any constant, it only has to be the same for every `migrate` run
+ADVISORY_LOCK_ID = 4111
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version varchar(16) PRIMARY KEY,
+        name varchar(200) NOT NULL,
+        applied_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def discover(dialect, directory=MIGRATIONS_DIR):
+    """
+    Returns [(version, name, path)] sorted by version, with the files for dialect
+    taking the place of the plain ones.
+    """
+    found = {}
+    for filename in os.listdir(directory):
+        match = FILE_RE.match(filename)
+        if not match:
+            continue
+        version, name, file_dialect = match.groups()
+        if file_dialect not in (None, dialect):
+            continue
+        if version in found and file_dialect is None:
+            continue
+        found[version] = (version, name, os.path.join(directory, filename))
+    return [found[version] for version in sorted(found, key=int)]
+
+
+def applied_versions(conn):
+    conn.execute(text(CREATE_TABLE))
+    conn.commit()
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def status(engine):
+    """
+    Returns [(version, name, applied)] for every migration.
+    """
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+        return [(version, name, version in done) for version, name, _ in discover(engine.dialect.name)]
+
+
+def apply(conn, version, name, sql):
+    record = "INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"
+    if conn.dialect.name == "sqlite":
+        # the sqlite3 driver only runs scripts through executescript(), which commits
+        # whatever is open before it starts, so the transaction is part of the script
+        raw = conn.connection.driver_connection
+        record = record.replace(":version", "'%s'" % version).replace(":name", "'%s'" % name)
+        try:
+            raw.executescript(f"BEGIN;\n{sql}\n;\n{record};\nCOMMIT;")
+        except Exception:
+            raw.rollback()
+            raise
+        return
+    conn.exec_driver_sql(sql)
+    conn.execute(text(record), {"version": version, "name": name})
+
+
+def run_migrations(engine, report=print):
+    """
+    Applies the pending migrations in order, calling report() before each one.
+    Returns the number applied. Stops at the first one that fails.
+    """
+    count = 0
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # two deploys migrating at once take turns
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        try:
+            done = applied_versions(conn)
+            for version, name, path in discover(conn.dialect.name):
+                if version in done:
+                    continue
+                report(f"applying {os.path.basename(path)}")
+                with open(path, encoding="utf-8") as f:
+                    sql = f.read()
+                start = time.perf_counter()
+                try:
+                    apply(conn, version, name, sql)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                report(f"applied {version}_{name} in {time.perf_counter() - start:.1f}s")
+                count += 1
+        finally:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+                conn.commit()
+    return count
@@ -0,0 +1,69 @@
+-- The BookHub tables.
+-- Every statement is IF NOT EXISTS, so on the existing course database this does
+-- nothing and later migrations build on the tables already there.
+-- Uniqueness of ratings and favorites per (user, book) comes from 004.
+
+CREATE TABLE IF NOT EXISTS users (
+    userid serial PRIMARY KEY,
+    username text NOT NULL,
+    user_email text,
+    preferences text
+);
+
+CREATE TABLE IF NOT EXISTS authors (
+    authorid serial PRIMARY KEY,
+    name text NOT NULL,
+    year_of_birth integer,
+    nationality text
+);
+
+CREATE TABLE IF NOT EXISTS genres (
+    genreid serial PRIMARY KEY,
+    genrename text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS books (
+    bookid serial PRIMARY KEY,
+    book_title text NOT NULL,
+    isbn text,
+    combined_rating numeric
+);
+
+CREATE TABLE IF NOT EXISTS book_authors (
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE,
+    authorid integer NOT NULL REFERENCES authors (authorid) ON DELETE CASCADE,
+    PRIMARY KEY (bookid, authorid)
+);
+
+CREATE TABLE IF NOT EXISTS bookgenres (
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE,
+    genreid integer NOT NULL REFERENCES genres (genreid) ON DELETE CASCADE,
+    PRIMARY KEY (bookid, genreid)
+);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    reviewid serial PRIMARY KEY,
+    userid integer NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE,
+    com_content text,
+    timestamp timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS comments (
+    commentid serial PRIMARY KEY,
+    userid integer NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    reviewid integer NOT NULL REFERENCES reviews (reviewid) ON DELETE CASCADE,
+    com_content text,
+    timestamp timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    userid integer NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE,
+    score integer
+);
+
+CREATE TABLE IF NOT EXISTS favorites (
+    userid integer NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE
+);
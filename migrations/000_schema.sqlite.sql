@@ -0,0 +1,68 @@
+-- SQLite version of 000_schema.sql, for a local development database.
+-- SQLite only enforces the foreign keys with PRAGMA foreign_keys = ON.
+-- Uniqueness of ratings and favorites per (user, book) comes from 004.
+
+CREATE TABLE IF NOT EXISTS users (
+    userid integer PRIMARY KEY,
+    username text NOT NULL,
+    user_email text,
+    preferences text
+);
+
+CREATE TABLE IF NOT EXISTS authors (
+    authorid integer PRIMARY KEY,
+    name text NOT NULL,
+    year_of_birth integer,
+    nationality text
+);
+
+CREATE TABLE IF NOT EXISTS genres (
+    genreid integer PRIMARY KEY,
+    genrename text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS books (
+    bookid integer PRIMARY KEY,
+    book_title text NOT NULL,
+    isbn text,
+    combined_rating real
+);
+
+CREATE TABLE IF NOT EXISTS book_authors (
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE,
+    authorid integer NOT NULL REFERENCES authors (authorid) ON DELETE CASCADE,
+    PRIMARY KEY (bookid, authorid)
+);
+
+CREATE TABLE IF NOT EXISTS bookgenres (
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE,
+    genreid integer NOT NULL REFERENCES genres (genreid) ON DELETE CASCADE,
+    PRIMARY KEY (bookid, genreid)
+);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    reviewid integer PRIMARY KEY,
+    userid integer NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE,
+    com_content text,
+    timestamp timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS comments (
+    commentid integer PRIMARY KEY,
+    userid integer NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    reviewid integer NOT NULL REFERENCES reviews (reviewid) ON DELETE CASCADE,
+    com_content text,
+    timestamp timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    userid integer NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE,
+    score integer
+);
+
+CREATE TABLE IF NOT EXISTS favorites (
+    userid integer NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    bookid integer NOT NULL REFERENCES books (bookid) ON DELETE CASCADE
+);
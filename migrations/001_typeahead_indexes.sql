@@ -0,0 +1,8 @@
+-- Indexes for the typeahead endpoints (/api/books, /api/users, /api/authors, /api/reviews).
+-- The endpoints match lower(column) LIKE 'prefix%'; text_pattern_ops lets Postgres
+-- answer that from the index whatever the database collation is.
+
+CREATE INDEX IF NOT EXISTS books_title_prefix_idx ON books (lower(book_title) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS users_username_prefix_idx ON users (lower(username) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS authors_name_prefix_idx ON authors (lower(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS reviews_bookid_idx ON reviews (bookid, reviewid);
@@ -0,0 +1,7 @@
+-- SQLite version of 001_typeahead_indexes.sql: plain expression indexes, SQLite has no
+-- operator classes.
+
+CREATE INDEX IF NOT EXISTS books_title_prefix_idx ON books (lower(book_title));
+CREATE INDEX IF NOT EXISTS users_username_prefix_idx ON users (lower(username));
+CREATE INDEX IF NOT EXISTS authors_name_prefix_idx ON authors (lower(name));
+CREATE INDEX IF NOT EXISTS reviews_bookid_idx ON reviews (bookid, reviewid);
@@ -0,0 +1,19 @@
+-- Search index for /search.
+-- Titles and author names get a generated tsvector column with a GIN index for ranked
+-- full-text matches, plus a trigram GIN index so substring (ILIKE '%q%') matches and
+-- the similarity() ranking don't need a sequential scan either.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(book_title, ''))) STORED;
+ALTER TABLE authors ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(name, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS books_search_idx ON books USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS authors_search_idx ON authors USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS books_title_trgm_idx ON books USING GIN (book_title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS authors_name_trgm_idx ON authors USING GIN (name gin_trgm_ops);
+
+-- the author branch of the search joins back to the books of each matching author
+CREATE INDEX IF NOT EXISTS book_authors_authorid_idx ON book_authors (authorid, bookid);
@@ -0,0 +1,4 @@
+-- SQLite version of 002_search_index.sql. /search uses the in-process SearchIndex on
+-- SQLite, so only the author -> books index is needed.
+
+CREATE INDEX IF NOT EXISTS book_authors_authorid_idx ON book_authors (authorid, bookid);
@@ -0,0 +1,53 @@
+-- Per-book rating summary for /top_books.
+-- book_rating_summary holds the count and sum of each book's ratings. A trigger on
+-- ratings keeps it current on every insert, update and delete, whichever code path
+-- wrote the rating, so /top_books reads the first k rows of an index instead of
+-- aggregating the whole ratings table.
+
+CREATE TABLE IF NOT EXISTS book_rating_summary (
+    bookid integer PRIMARY KEY REFERENCES books (bookid) ON DELETE CASCADE,
+    rating_count integer NOT NULL,
+    rating_sum bigint NOT NULL,
+    rating_avg numeric GENERATED ALWAYS AS (rating_sum::numeric / NULLIF(rating_count, 0)) STORED
+);
+
+CREATE INDEX IF NOT EXISTS book_rating_summary_avg_idx ON book_rating_summary (rating_avg DESC, bookid);
+
+-- the genre filter on /top_books
+CREATE INDEX IF NOT EXISTS bookgenres_genreid_idx ON bookgenres (genreid, bookid);
+
+CREATE OR REPLACE FUNCTION book_rating_summary_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.score IS NOT NULL THEN
+        UPDATE book_rating_summary
+        SET rating_count = rating_count - 1,
+            rating_sum = rating_sum - OLD.score
+        WHERE bookid = OLD.bookid;
+        -- books without ratings have no summary row, so rating_avg is never NULL
+        DELETE FROM book_rating_summary WHERE bookid = OLD.bookid AND rating_count <= 0;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.score IS NOT NULL THEN
+        INSERT INTO book_rating_summary (bookid, rating_count, rating_sum)
+        VALUES (NEW.bookid, 1, NEW.score)
+        ON CONFLICT (bookid) DO UPDATE
+        SET rating_count = book_rating_summary.rating_count + 1,
+            rating_sum = book_rating_summary.rating_sum + EXCLUDED.rating_sum;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- no rating can change between the backfill below and the trigger going live
+LOCK TABLE ratings IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS ratings_summary_trg ON ratings;
+CREATE TRIGGER ratings_summary_trg
+AFTER INSERT OR DELETE OR UPDATE OF score, bookid ON ratings
+FOR EACH ROW EXECUTE FUNCTION book_rating_summary_apply();
+
+DELETE FROM book_rating_summary;
+INSERT INTO book_rating_summary (bookid, rating_count, rating_sum)
+SELECT bookid, COUNT(score), SUM(score)
+FROM ratings
+WHERE score IS NOT NULL
+GROUP BY bookid;
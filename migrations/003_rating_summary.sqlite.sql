@@ -0,0 +1,53 @@
+-- SQLite version of 003_rating_summary.sql. SQLite triggers can't share a function,
+-- so there is one per kind of change.
+
+CREATE TABLE IF NOT EXISTS book_rating_summary (
+    bookid integer PRIMARY KEY REFERENCES books (bookid) ON DELETE CASCADE,
+    rating_count integer NOT NULL,
+    rating_sum integer NOT NULL,
+    rating_avg real GENERATED ALWAYS AS (CAST(rating_sum AS real) / NULLIF(rating_count, 0)) STORED
+);
+
+CREATE INDEX IF NOT EXISTS book_rating_summary_avg_idx ON book_rating_summary (rating_avg DESC, bookid);
+
+-- the genre filter on /top_books
+CREATE INDEX IF NOT EXISTS bookgenres_genreid_idx ON bookgenres (genreid, bookid);
+
+CREATE TRIGGER IF NOT EXISTS ratings_summary_ins AFTER INSERT ON ratings WHEN NEW.score IS NOT NULL
+BEGIN
+    INSERT INTO book_rating_summary (bookid, rating_count, rating_sum)
+    VALUES (NEW.bookid, 1, NEW.score)
+    ON CONFLICT (bookid) DO UPDATE
+    SET rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ratings_summary_del AFTER DELETE ON ratings WHEN OLD.score IS NOT NULL
+BEGIN
+    UPDATE book_rating_summary
+    SET rating_count = rating_count - 1,
+        rating_sum = rating_sum - OLD.score
+    WHERE bookid = OLD.bookid;
+    DELETE FROM book_rating_summary WHERE bookid = OLD.bookid AND rating_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ratings_summary_upd AFTER UPDATE OF score, bookid ON ratings
+BEGIN
+    UPDATE book_rating_summary
+    SET rating_count = rating_count - 1,
+        rating_sum = rating_sum - OLD.score
+    WHERE bookid = OLD.bookid AND OLD.score IS NOT NULL;
+    DELETE FROM book_rating_summary WHERE bookid = OLD.bookid AND rating_count <= 0;
+    INSERT INTO book_rating_summary (bookid, rating_count, rating_sum)
+    SELECT NEW.bookid, 1, NEW.score WHERE NEW.score IS NOT NULL
+    ON CONFLICT (bookid) DO UPDATE
+    SET rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum;
+END;
+
+DELETE FROM book_rating_summary;
+INSERT INTO book_rating_summary (bookid, rating_count, rating_sum)
+SELECT bookid, COUNT(score), SUM(score)
+FROM ratings
+WHERE score IS NOT NULL
+GROUP BY bookid;
@@ -0,0 +1,49 @@
+-- Unique constraints behind the single-statement writes:
+--   rate_book       INSERT ... ON CONFLICT (userid, bookid) DO UPDATE
+--   add_favorite    INSERT ... ON CONFLICT DO NOTHING
+--   add_genre       INSERT ... ON CONFLICT DO NOTHING  (case-insensitive name)
+--   add_author      INSERT ... ON CONFLICT DO NOTHING  (case-insensitive name)
+-- Existing duplicates are removed first so the indexes can be built.
+
+-- keep one rating / favorite per (user, book)
+DELETE FROM ratings a USING ratings b
+WHERE a.userid = b.userid AND a.bookid = b.bookid AND a.ctid < b.ctid;
+CREATE UNIQUE INDEX IF NOT EXISTS ratings_user_book_key ON ratings (userid, bookid);
+
+DELETE FROM favorites a USING favorites b
+WHERE a.userid = b.userid AND a.bookid = b.bookid AND a.ctid < b.ctid;
+CREATE UNIQUE INDEX IF NOT EXISTS favorites_user_book_key ON favorites (userid, bookid);
+
+-- same-named genres and authors: link their books to the oldest one instead, once per
+-- book (a book can be in "Fantasy" and "fantasy"), then drop the others
+INSERT INTO bookgenres (bookid, genreid)
+SELECT DISTINCT bg.bookid, d.keep_id
+FROM bookgenres bg
+JOIN (
+    SELECT genreid, MIN(genreid) OVER (PARTITION BY lower(genrename)) AS keep_id FROM genres
+) d ON bg.genreid = d.genreid AND d.genreid <> d.keep_id
+WHERE NOT EXISTS (SELECT 1 FROM bookgenres x WHERE x.bookid = bg.bookid AND x.genreid = d.keep_id);
+DELETE FROM bookgenres
+WHERE genreid IN (
+    SELECT genreid FROM genres
+    WHERE genreid NOT IN (SELECT MIN(genreid) FROM genres GROUP BY lower(genrename))
+);
+DELETE FROM genres a USING genres b
+WHERE lower(a.genrename) = lower(b.genrename) AND a.genreid > b.genreid;
+CREATE UNIQUE INDEX IF NOT EXISTS genres_name_key ON genres (lower(genrename));
+
+INSERT INTO book_authors (bookid, authorid)
+SELECT DISTINCT ba.bookid, d.keep_id
+FROM book_authors ba
+JOIN (
+    SELECT authorid, MIN(authorid) OVER (PARTITION BY lower(name)) AS keep_id FROM authors
+) d ON ba.authorid = d.authorid AND d.authorid <> d.keep_id
+WHERE NOT EXISTS (SELECT 1 FROM book_authors x WHERE x.bookid = ba.bookid AND x.authorid = d.keep_id);
+DELETE FROM book_authors
+WHERE authorid IN (
+    SELECT authorid FROM authors
+    WHERE authorid NOT IN (SELECT MIN(authorid) FROM authors GROUP BY lower(name))
+);
+DELETE FROM authors a USING authors b
+WHERE lower(a.name) = lower(b.name) AND a.authorid > b.authorid;
+CREATE UNIQUE INDEX IF NOT EXISTS authors_name_key ON authors (lower(name));
@@ -0,0 +1,42 @@
+-- SQLite version of 004_unique_constraints.sql, rowid instead of ctid.
+
+DELETE FROM ratings
+WHERE rowid NOT IN (SELECT MAX(rowid) FROM ratings GROUP BY userid, bookid);
+CREATE UNIQUE INDEX IF NOT EXISTS ratings_user_book_key ON ratings (userid, bookid);
+
+DELETE FROM favorites
+WHERE rowid NOT IN (SELECT MAX(rowid) FROM favorites GROUP BY userid, bookid);
+CREATE UNIQUE INDEX IF NOT EXISTS favorites_user_book_key ON favorites (userid, bookid);
+
+-- a book in two same-named genres gets linked to the kept one once
+INSERT INTO bookgenres (bookid, genreid)
+SELECT DISTINCT bg.bookid, d.keep_id
+FROM bookgenres bg
+JOIN (
+    SELECT genreid, MIN(genreid) OVER (PARTITION BY lower(genrename)) AS keep_id FROM genres
+) d ON bg.genreid = d.genreid AND d.genreid <> d.keep_id
+WHERE NOT EXISTS (SELECT 1 FROM bookgenres x WHERE x.bookid = bg.bookid AND x.genreid = d.keep_id);
+DELETE FROM bookgenres
+WHERE genreid IN (
+    SELECT genreid FROM genres
+    WHERE genreid NOT IN (SELECT MIN(genreid) FROM genres GROUP BY lower(genrename))
+);
+DELETE FROM genres
+WHERE genreid NOT IN (SELECT MIN(genreid) FROM genres GROUP BY lower(genrename));
+CREATE UNIQUE INDEX IF NOT EXISTS genres_name_key ON genres (lower(genrename));
+
+INSERT INTO book_authors (bookid, authorid)
+SELECT DISTINCT ba.bookid, d.keep_id
+FROM book_authors ba
+JOIN (
+    SELECT authorid, MIN(authorid) OVER (PARTITION BY lower(name)) AS keep_id FROM authors
+) d ON ba.authorid = d.authorid AND d.authorid <> d.keep_id
+WHERE NOT EXISTS (SELECT 1 FROM book_authors x WHERE x.bookid = ba.bookid AND x.authorid = d.keep_id);
+DELETE FROM book_authors
+WHERE authorid IN (
+    SELECT authorid FROM authors
+    WHERE authorid NOT IN (SELECT MIN(authorid) FROM authors GROUP BY lower(name))
+);
+DELETE FROM authors
+WHERE authorid NOT IN (SELECT MIN(authorid) FROM authors GROUP BY lower(name));
+CREATE UNIQUE INDEX IF NOT EXISTS authors_name_key ON authors (lower(name));
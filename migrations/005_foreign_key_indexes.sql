@@ -0,0 +1,20 @@
+-- Indexes on the foreign keys and timestamps the routes join, filter and sort on.
+-- Postgres doesn't index the referencing side of a foreign key, so without these
+-- deleting a book or user scans the child tables and the per-user and per-book
+-- lookups read every row.
+
+-- /reviews and /comments, newest first
+CREATE INDEX IF NOT EXISTS reviews_timestamp_idx ON reviews (timestamp DESC, reviewid DESC);
+CREATE INDEX IF NOT EXISTS comments_timestamp_idx ON comments (timestamp DESC, commentid DESC);
+
+-- the comments of a review in order (/reviews_with_comments and its "load more")
+CREATE INDEX IF NOT EXISTS comments_reviewid_idx ON comments (reviewid, timestamp, commentid);
+
+-- per-user lookups and deletes
+CREATE INDEX IF NOT EXISTS reviews_userid_idx ON reviews (userid);
+CREATE INDEX IF NOT EXISTS comments_userid_idx ON comments (userid);
+
+-- per-book lookups and deletes; the unique (userid, bookid) indexes from 004 cover the
+-- user side, and the primary keys of book_authors and bookgenres start with bookid
+CREATE INDEX IF NOT EXISTS ratings_bookid_idx ON ratings (bookid);
+CREATE INDEX IF NOT EXISTS favorites_bookid_idx ON favorites (bookid);
@@ -0,0 +1,92 @@
+-- Per-user activity counters and indexes for /users/<user_id>.
+-- user_stats holds how many reviews, comments, ratings and favorites each user has and
+-- the sum of the scores they gave. Triggers keep it current in the same transaction as
+-- every write, including the rows removed by deleting a book or review, so the page reads
+-- one row instead of counting four tables.
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    userid integer PRIMARY KEY REFERENCES users (userid) ON DELETE CASCADE,
+    review_count integer NOT NULL DEFAULT 0,
+    comment_count integer NOT NULL DEFAULT 0,
+    rating_count integer NOT NULL DEFAULT 0,
+    rating_sum bigint NOT NULL DEFAULT 0,
+    favorite_count integer NOT NULL DEFAULT 0,
+    rating_avg numeric GENERATED ALWAYS AS (rating_sum::numeric / NULLIF(rating_count, 0)) STORED
+);
+
+-- a user's newest reviews and comments; they also cover the per-user deletes that the
+-- single column indexes from 005 were for
+CREATE INDEX IF NOT EXISTS reviews_userid_timestamp_idx ON reviews (userid, timestamp DESC, reviewid DESC);
+CREATE INDEX IF NOT EXISTS comments_userid_timestamp_idx ON comments (userid, timestamp DESC, commentid DESC);
+DROP INDEX IF EXISTS reviews_userid_idx;
+DROP INDEX IF EXISTS comments_userid_idx;
+
+-- reviews, comments and favorites: the trigger argument is the column to count in
+CREATE OR REPLACE FUNCTION user_stats_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        -- only an UPDATE, never an insert: while a user is being deleted its row is already gone
+        EXECUTE format('UPDATE user_stats SET %1$I = %1$I - 1 WHERE userid = $1', TG_ARGV[0])
+        USING OLD.userid;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        EXECUTE format('INSERT INTO user_stats (userid, %1$I) VALUES ($1, 1)
+                        ON CONFLICT (userid) DO UPDATE SET %1$I = user_stats.%1$I + 1', TG_ARGV[0])
+        USING NEW.userid;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ratings without a score aren't counted, same as in book_rating_summary (003)
+CREATE OR REPLACE FUNCTION user_stats_ratings() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.score IS NOT NULL THEN
+        UPDATE user_stats
+        SET rating_count = rating_count - 1,
+            rating_sum = rating_sum - OLD.score
+        WHERE userid = OLD.userid;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.score IS NOT NULL THEN
+        INSERT INTO user_stats (userid, rating_count, rating_sum)
+        VALUES (NEW.userid, 1, NEW.score)
+        ON CONFLICT (userid) DO UPDATE
+        SET rating_count = user_stats.rating_count + 1,
+            rating_sum = user_stats.rating_sum + EXCLUDED.rating_sum;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- nothing can change between the backfill below and the triggers going live
+LOCK TABLE reviews, comments, ratings, favorites IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS reviews_user_stats_trg ON reviews;
+CREATE TRIGGER reviews_user_stats_trg
+AFTER INSERT OR DELETE OR UPDATE OF userid ON reviews
+FOR EACH ROW EXECUTE FUNCTION user_stats_count('review_count');
+
+DROP TRIGGER IF EXISTS comments_user_stats_trg ON comments;
+CREATE TRIGGER comments_user_stats_trg
+AFTER INSERT OR DELETE OR UPDATE OF userid ON comments
+FOR EACH ROW EXECUTE FUNCTION user_stats_count('comment_count');
+
+DROP TRIGGER IF EXISTS favorites_user_stats_trg ON favorites;
+CREATE TRIGGER favorites_user_stats_trg
+AFTER INSERT OR DELETE OR UPDATE OF userid ON favorites
+FOR EACH ROW EXECUTE FUNCTION user_stats_count('favorite_count');
+
+DROP TRIGGER IF EXISTS ratings_user_stats_trg ON ratings;
+CREATE TRIGGER ratings_user_stats_trg
+AFTER INSERT OR DELETE OR UPDATE OF score, userid ON ratings
+FOR EACH ROW EXECUTE FUNCTION user_stats_ratings();
+
+DELETE FROM user_stats;
+INSERT INTO user_stats (userid, review_count, comment_count, rating_count, rating_sum, favorite_count)
+SELECT u.userid,
+       (SELECT COUNT(*) FROM reviews re WHERE re.userid = u.userid),
+       (SELECT COUNT(*) FROM comments c WHERE c.userid = u.userid),
+       (SELECT COUNT(score) FROM ratings rat WHERE rat.userid = u.userid),
+       (SELECT COALESCE(SUM(score), 0) FROM ratings rat WHERE rat.userid = u.userid),
+       (SELECT COUNT(*) FROM favorites fav WHERE fav.userid = u.userid)
+FROM users u;
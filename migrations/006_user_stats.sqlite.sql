@@ -0,0 +1,109 @@
+-- SQLite version of 006_user_stats.sql, with a trigger per table and kind of change.
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    userid integer PRIMARY KEY REFERENCES users (userid) ON DELETE CASCADE,
+    review_count integer NOT NULL DEFAULT 0,
+    comment_count integer NOT NULL DEFAULT 0,
+    rating_count integer NOT NULL DEFAULT 0,
+    rating_sum integer NOT NULL DEFAULT 0,
+    favorite_count integer NOT NULL DEFAULT 0,
+    rating_avg real GENERATED ALWAYS AS (CAST(rating_sum AS real) / NULLIF(rating_count, 0)) STORED
+);
+
+CREATE INDEX IF NOT EXISTS reviews_userid_timestamp_idx ON reviews (userid, timestamp DESC, reviewid DESC);
+CREATE INDEX IF NOT EXISTS comments_userid_timestamp_idx ON comments (userid, timestamp DESC, commentid DESC);
+DROP INDEX IF EXISTS reviews_userid_idx;
+DROP INDEX IF EXISTS comments_userid_idx;
+
+CREATE TRIGGER IF NOT EXISTS reviews_user_stats_ins AFTER INSERT ON reviews
+BEGIN
+    INSERT INTO user_stats (userid, review_count) VALUES (NEW.userid, 1)
+    ON CONFLICT (userid) DO UPDATE SET review_count = review_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS reviews_user_stats_del AFTER DELETE ON reviews
+BEGIN
+    UPDATE user_stats SET review_count = review_count - 1 WHERE userid = OLD.userid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS reviews_user_stats_upd AFTER UPDATE OF userid ON reviews
+BEGIN
+    UPDATE user_stats SET review_count = review_count - 1 WHERE userid = OLD.userid;
+    INSERT INTO user_stats (userid, review_count) VALUES (NEW.userid, 1)
+    ON CONFLICT (userid) DO UPDATE SET review_count = review_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_user_stats_ins AFTER INSERT ON comments
+BEGIN
+    INSERT INTO user_stats (userid, comment_count) VALUES (NEW.userid, 1)
+    ON CONFLICT (userid) DO UPDATE SET comment_count = comment_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_user_stats_del AFTER DELETE ON comments
+BEGIN
+    UPDATE user_stats SET comment_count = comment_count - 1 WHERE userid = OLD.userid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_user_stats_upd AFTER UPDATE OF userid ON comments
+BEGIN
+    UPDATE user_stats SET comment_count = comment_count - 1 WHERE userid = OLD.userid;
+    INSERT INTO user_stats (userid, comment_count) VALUES (NEW.userid, 1)
+    ON CONFLICT (userid) DO UPDATE SET comment_count = comment_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS favorites_user_stats_ins AFTER INSERT ON favorites
+BEGIN
+    INSERT INTO user_stats (userid, favorite_count) VALUES (NEW.userid, 1)
+    ON CONFLICT (userid) DO UPDATE SET favorite_count = favorite_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS favorites_user_stats_del AFTER DELETE ON favorites
+BEGIN
+    UPDATE user_stats SET favorite_count = favorite_count - 1 WHERE userid = OLD.userid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS favorites_user_stats_upd AFTER UPDATE OF userid ON favorites
+BEGIN
+    UPDATE user_stats SET favorite_count = favorite_count - 1 WHERE userid = OLD.userid;
+    INSERT INTO user_stats (userid, favorite_count) VALUES (NEW.userid, 1)
+    ON CONFLICT (userid) DO UPDATE SET favorite_count = favorite_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ratings_user_stats_ins AFTER INSERT ON ratings WHEN NEW.score IS NOT NULL
+BEGIN
+    INSERT INTO user_stats (userid, rating_count, rating_sum) VALUES (NEW.userid, 1, NEW.score)
+    ON CONFLICT (userid) DO UPDATE
+    SET rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ratings_user_stats_del AFTER DELETE ON ratings WHEN OLD.score IS NOT NULL
+BEGIN
+    UPDATE user_stats
+    SET rating_count = rating_count - 1,
+        rating_sum = rating_sum - OLD.score
+    WHERE userid = OLD.userid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ratings_user_stats_upd AFTER UPDATE OF score, userid ON ratings
+BEGIN
+    UPDATE user_stats
+    SET rating_count = rating_count - 1,
+        rating_sum = rating_sum - OLD.score
+    WHERE userid = OLD.userid AND OLD.score IS NOT NULL;
+    INSERT INTO user_stats (userid, rating_count, rating_sum)
+    SELECT NEW.userid, 1, NEW.score WHERE NEW.score IS NOT NULL
+    ON CONFLICT (userid) DO UPDATE
+    SET rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum;
+END;
+
+DELETE FROM user_stats;
+INSERT INTO user_stats (userid, review_count, comment_count, rating_count, rating_sum, favorite_count)
+SELECT u.userid,
+       (SELECT COUNT(*) FROM reviews re WHERE re.userid = u.userid),
+       (SELECT COUNT(*) FROM comments c WHERE c.userid = u.userid),
+       (SELECT COUNT(score) FROM ratings rat WHERE rat.userid = u.userid),
+       (SELECT COALESCE(SUM(score), 0) FROM ratings rat WHERE rat.userid = u.userid),
+       (SELECT COUNT(*) FROM favorites fav WHERE fav.userid = u.userid)
+FROM users u;
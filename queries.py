@@ -0,0 +1,661 @@
+"""
+The SQL statements of server.py and asgi.py, each built once when the module is imported.
+
+SQLAlchemy compiles a statement the first time an engine runs it and keeps the result
+in the engine's compiled cache, so handlers that pass these objects skip building and
+compiling the SQL on every request. On asyncpg (asgi.py) each connection also prepares
+a statement on the server the first time it runs it and reuses the plan afterwards;
+psycopg2 has no server-side prepared statements, there only the client work is saved.
+
+Every statement has a name. The query timer of server.py passes each execution to
+record(), and stats() returns how often each one ran and for how long, which /metrics
+exports.
+"""
+import threading
+
+from sqlalchemy import bindparam, text
+
+
+class Query:
+    __slots__ = ("name", "statement", "calls", "seconds")
+
+    def __init__(self, name, statement):
+        self.name = name
+        self.statement = statement
+        self.calls = 0
+        self.seconds = 0.0
+
+
+registry = {}        # name -> Query
+by_statement = {}    # statement -> Query, to find the Query of an execution
+stats_lock = threading.Lock()
+
+
+def query(name, sql, expanding=()):
+    """
+    Registers sql under name and returns its statement.
+    expanding names the parameters that take a list (IN :ids).
+    """
+    if name in registry:
+        raise ValueError(f"query {name!r} is registered twice")
+    statement = text(sql)
+    if expanding:
+        statement = statement.bindparams(*(bindparam(param, expanding=True) for param in expanding))
+    registry[name] = by_statement[statement] = Query(name, statement)
+    return statement
+
+
+def stats():
+    """
+    Returns [(name, calls, seconds)] for every registered statement, by name.
+    """
+    with stats_lock:
+        return [(q.name, q.calls, q.seconds) for q in sorted(registry.values(), key=lambda q: q.name)]
+
+
+def record(context, elapsed):
+    """
+    Counts an execution that took elapsed seconds, if it ran a registered statement.
+    """
+    compiled = context.compiled if context is not None else None
+    entry = by_statement.get(compiled.statement) if compiled is not None else None
+    if entry is None:
+        return
+    with stats_lock:
+        entry.calls += 1
+        entry.seconds += elapsed
+
+
+#
+# Lookups and typeahead.
+#
+GENRE_LOOKUP = query("genre_lookup", "SELECT genreid, genrename FROM genres")
+
+TYPEAHEAD_BOOKS = query("typeahead_books", """
+    SELECT bookid, book_title FROM books
+    WHERE lower(book_title) LIKE :prefix ESCAPE '\\'
+    ORDER BY lower(book_title), bookid
+    LIMIT :limit
+""")
+
+TYPEAHEAD_USERS = query("typeahead_users", """
+    SELECT userid, username FROM users
+    WHERE lower(username) LIKE :prefix ESCAPE '\\'
+    ORDER BY lower(username), userid
+    LIMIT :limit
+""")
+
+TYPEAHEAD_AUTHORS = query("typeahead_authors", """
+    SELECT authorid, name FROM authors
+    WHERE lower(name) LIKE :prefix ESCAPE '\\'
+    ORDER BY lower(name), authorid
+    LIMIT :limit
+""")
+
+REVIEWS_OF_BOOK = query("reviews_of_book", """
+    SELECT re.reviewid, u.username, re.com_content
+    FROM reviews re
+    JOIN users u ON re.userid = u.userid
+    WHERE re.bookid = :bid
+    ORDER BY re.reviewid DESC
+    LIMIT :limit
+""")
+
+
+#
+# List pages. The *_AFTER statements continue after the page cursor :a0 (, :a1).
+#
+BOOKS_FIRST = query("books_first", """
+    SELECT bookid, book_title, isbn, combined_rating FROM books
+    ORDER BY bookid
+    LIMIT :limit
+""")
+
+BOOKS_AFTER = query("books_after", """
+    SELECT bookid, book_title, isbn, combined_rating FROM books
+    WHERE bookid > :a0
+    ORDER BY bookid
+    LIMIT :limit
+""")
+
+USERS_FIRST = query("users_first", """
+    SELECT userid, username, user_email, preferences FROM users
+    ORDER BY userid
+    LIMIT :limit
+""")
+
+USERS_AFTER = query("users_after", """
+    SELECT userid, username, user_email, preferences FROM users
+    WHERE userid > :a0
+    ORDER BY userid
+    LIMIT :limit
+""")
+
+REVIEWS_FIRST = query("reviews_first", """
+    SELECT re.reviewid, u.username, b.book_title, re.com_content, re.timestamp
+    FROM reviews re
+    JOIN users u ON re.userid = u.userid
+    JOIN books b ON re.bookid = b.bookid
+    ORDER BY re.timestamp DESC, re.reviewid DESC
+    LIMIT :limit
+""")
+
+# the cursor is just the reviewid, its timestamp is looked up by primary key
+REVIEWS_AFTER = query("reviews_after", """
+    SELECT re.reviewid, u.username, b.book_title, re.com_content, re.timestamp
+    FROM reviews re
+    JOIN users u ON re.userid = u.userid
+    JOIN books b ON re.bookid = b.bookid
+    WHERE (re.timestamp, re.reviewid) < (SELECT timestamp, reviewid FROM reviews WHERE reviewid = :a0)
+    ORDER BY re.timestamp DESC, re.reviewid DESC
+    LIMIT :limit
+""")
+
+RATINGS_FIRST = query("ratings_first", """
+    SELECT rat.userid, u.username, rat.bookid, b.book_title, rat.score
+    FROM ratings rat
+    JOIN users u ON rat.userid = u.userid
+    JOIN books b ON rat.bookid = b.bookid
+    ORDER BY rat.userid, rat.bookid
+    LIMIT :limit
+""")
+
+RATINGS_AFTER = query("ratings_after", """
+    SELECT rat.userid, u.username, rat.bookid, b.book_title, rat.score
+    FROM ratings rat
+    JOIN users u ON rat.userid = u.userid
+    JOIN books b ON rat.bookid = b.bookid
+    WHERE (rat.userid, rat.bookid) > (:a0, :a1)
+    ORDER BY rat.userid, rat.bookid
+    LIMIT :limit
+""")
+
+COMMENTS_FIRST = query("comments_first", """
+    SELECT com.commentid, u.username, re.com_content, com.com_content, com.timestamp
+    FROM comments com
+    JOIN users u ON com.userid = u.userid
+    JOIN reviews re ON com.reviewid = re.reviewid
+    ORDER BY com.timestamp DESC, com.commentid DESC
+    LIMIT :limit
+""")
+
+COMMENTS_AFTER = query("comments_after", """
+    SELECT com.commentid, u.username, re.com_content, com.com_content, com.timestamp
+    FROM comments com
+    JOIN users u ON com.userid = u.userid
+    JOIN reviews re ON com.reviewid = re.reviewid
+    WHERE (com.timestamp, com.commentid) < (SELECT timestamp, commentid FROM comments WHERE commentid = :a0)
+    ORDER BY com.timestamp DESC, com.commentid DESC
+    LIMIT :limit
+""")
+
+FAVORITES_FIRST = query("favorites_first", """
+    SELECT fav.userid, u.username, fav.bookid, b.book_title
+    FROM favorites fav
+    JOIN users u ON fav.userid = u.userid
+    JOIN books b ON fav.bookid = b.bookid
+    ORDER BY u.username, fav.userid, fav.bookid
+    LIMIT :limit
+""")
+
+# the cursor is (userid, bookid), the username is looked up by primary key
+FAVORITES_AFTER = query("favorites_after", """
+    SELECT fav.userid, u.username, fav.bookid, b.book_title
+    FROM favorites fav
+    JOIN users u ON fav.userid = u.userid
+    JOIN books b ON fav.bookid = b.bookid
+    WHERE (u.username, fav.userid, fav.bookid) > ((SELECT username FROM users WHERE userid = :a0), :a0, :a1)
+    ORDER BY u.username, fav.userid, fav.bookid
+    LIMIT :limit
+""")
+
+GENRES_LIST = query("genres_list", "SELECT genreid, genrename FROM genres ORDER BY genrename")
+
+AUTHORS_LIST = query("authors_list", """
+    SELECT a.authorid, a.name, a.year_of_birth, a.nationality
+    FROM authors a
+    ORDER BY a.name
+""")
+
+AUTHOR_BOOKS = query("author_books", """
+    SELECT b.bookid, b.book_title, b.isbn, b.combined_rating
+    FROM books b
+    JOIN book_authors ba ON b.bookid = ba.bookid
+    WHERE ba.authorid = :aid
+""")
+
+
+#
+# Top books, from book_rating_summary (migrations/003_rating_summary.sql).
+#
+TOP_BOOKS = query("top_books", """
+    SELECT b.book_title, ROUND(s.rating_avg, 2) AS average_rating, s.rating_count, b.bookid
+    FROM book_rating_summary s
+    JOIN books b ON b.bookid = s.bookid
+    WHERE s.rating_count >= :min_votes
+    ORDER BY s.rating_avg DESC, s.bookid
+    LIMIT :limit
+""")
+
+TOP_BOOKS_IN_GENRE = query("top_books_in_genre", """
+    SELECT b.book_title, ROUND(s.rating_avg, 2) AS average_rating, s.rating_count, b.bookid
+    FROM book_rating_summary s
+    JOIN bookgenres bg ON bg.bookid = s.bookid AND bg.genreid = :genre_id
+    JOIN books b ON b.bookid = s.bookid
+    WHERE s.rating_count >= :min_votes
+    ORDER BY s.rating_avg DESC, s.bookid
+    LIMIT :limit
+""")
+
+
+#
+# Reviews by genre and reviews with their comments.
+#
+# the newest reviews of a genre, for its feed (server.GenreFeeds)
+GENRE_FEED = query("genre_feed", """
+    SELECT r.reviewid
+    FROM reviews r
+    JOIN bookgenres bkg ON r.bookid = bkg.bookid
+    WHERE bkg.genreid = :genre_id
+    ORDER BY r.timestamp DESC, r.reviewid DESC
+    LIMIT :limit
+""")
+
+REVIEWS_BY_IDS = query("reviews_by_ids", """
+    SELECT b.book_title, u.username, r.com_content, r.timestamp, r.reviewid
+    FROM reviews r
+    JOIN users u ON r.userid = u.userid
+    JOIN books b ON r.bookid = b.bookid
+    WHERE r.reviewid IN :ids
+""", expanding=("ids",))
+
+# pages past the end of a genre's feed
+REVIEWS_BY_GENRE = query("reviews_by_genre", """
+    SELECT b.book_title, u.username, r.com_content, r.timestamp, r.reviewid
+    FROM reviews r
+    JOIN users u ON r.userid = u.userid
+    JOIN books b ON r.bookid = b.bookid
+    JOIN bookgenres bkg ON b.bookid = bkg.bookid
+    WHERE bkg.genreid = :genre_id
+    ORDER BY r.timestamp DESC, r.reviewid DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+GENRES_OF_BOOK = query("genres_of_book", "SELECT genreid FROM bookgenres WHERE bookid = :bid")
+
+REVIEWS_WITH_COMMENT_COUNTS = query("reviews_with_comment_counts", """
+    SELECT r.reviewid, b.book_title, r.com_content AS review_content, u.username AS reviewer,
+           (SELECT COUNT(*) FROM comments c WHERE c.reviewid = r.reviewid) AS comment_count
+    FROM reviews r
+    JOIN books b ON r.bookid = b.bookid
+    JOIN users u ON r.userid = u.userid
+    WHERE r.reviewid > :after
+    ORDER BY r.reviewid
+    LIMIT :limit
+""")
+
+FIRST_COMMENTS_OF_REVIEWS = query("first_comments_of_reviews", """
+    SELECT reviewid, comment_id, comment_content, commenter, timestamp
+    FROM (
+        SELECT com.reviewid, com.commentid AS comment_id, com.com_content AS comment_content,
+               cu.username AS commenter, com.timestamp,
+               ROW_NUMBER() OVER (PARTITION BY com.reviewid ORDER BY com.timestamp, com.commentid) AS n
+        FROM comments com
+        JOIN users cu ON cu.userid = com.userid
+        WHERE com.reviewid IN :ids
+    ) ranked
+    WHERE n <= :per_review
+    ORDER BY reviewid, timestamp, comment_id
+""", expanding=("ids",))
+
+REVIEW_COMMENTS_FIRST = query("review_comments_first", """
+    SELECT com.commentid AS comment_id, com.com_content AS comment_content,
+           cu.username AS commenter, com.timestamp
+    FROM comments com
+    JOIN users cu ON cu.userid = com.userid
+    WHERE com.reviewid = :rid
+    ORDER BY com.timestamp, com.commentid
+    LIMIT :limit
+""")
+
+# continues after the last comment the page already shows, in the same order
+REVIEW_COMMENTS_AFTER = query("review_comments_after", """
+    SELECT com.commentid AS comment_id, com.com_content AS comment_content,
+           cu.username AS commenter, com.timestamp
+    FROM comments com
+    JOIN users cu ON cu.userid = com.userid
+    WHERE com.reviewid = :rid
+      AND (com.timestamp, com.commentid) > (SELECT timestamp, commentid FROM comments WHERE commentid = :after)
+    ORDER BY com.timestamp, com.commentid
+    LIMIT :limit
+""")
+
+
+#
+# One user's activity, /users/<user_id>. The counters come from user_stats
+# (migrations/006_user_stats.sql); users without any activity have no row there.
+#
+USER_PROFILE = query("user_profile", """
+    SELECT u.userid, u.username, u.user_email, u.preferences,
+           COALESCE(s.review_count, 0) AS review_count, COALESCE(s.comment_count, 0) AS comment_count,
+           COALESCE(s.rating_count, 0) AS rating_count, COALESCE(s.favorite_count, 0) AS favorite_count,
+           s.rating_avg
+    FROM users u
+    LEFT JOIN user_stats s ON s.userid = u.userid
+    WHERE u.userid = :uid
+""")
+
+# The newest :limit of each kind in one statement, each part read from an index on userid.
+# Ratings and favorites have no timestamp, the latest book ids come first. The casts give
+# the NULL columns the type of the other parts on Postgres.
+USER_ACTIVITY = query("user_activity", """
+    SELECT * FROM (
+        SELECT 'review' AS kind, re.reviewid AS id, b.book_title, re.com_content AS content,
+               CAST(NULL AS integer) AS score, re.timestamp
+        FROM reviews re
+        JOIN books b ON b.bookid = re.bookid
+        WHERE re.userid = :uid
+        ORDER BY re.timestamp DESC, re.reviewid DESC
+        LIMIT :limit
+    ) user_reviews
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'comment', com.commentid, b.book_title, com.com_content, CAST(NULL AS integer), com.timestamp
+        FROM comments com
+        JOIN reviews re ON re.reviewid = com.reviewid
+        JOIN books b ON b.bookid = re.bookid
+        WHERE com.userid = :uid
+        ORDER BY com.timestamp DESC, com.commentid DESC
+        LIMIT :limit
+    ) user_comments
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'rating', rat.bookid, b.book_title, CAST(NULL AS text), rat.score, CAST(NULL AS timestamp)
+        FROM ratings rat
+        JOIN books b ON b.bookid = rat.bookid
+        WHERE rat.userid = :uid
+        ORDER BY rat.bookid DESC
+        LIMIT :limit
+    ) user_ratings
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'favorite', fav.bookid, b.book_title, CAST(NULL AS text), CAST(NULL AS integer),
+               CAST(NULL AS timestamp)
+        FROM favorites fav
+        JOIN books b ON b.bookid = fav.bookid
+        WHERE fav.userid = :uid
+        ORDER BY fav.bookid DESC
+        LIMIT :limit
+    ) user_favorites
+""")
+
+
+#
+# Search. SEARCH is the Postgres one (migrations/002_search_index.sql); the other two
+# load server.SearchIndex on other databases.
+#
+SEARCH = query("search", """
+    WITH q AS (
+        SELECT websearch_to_tsquery('english', :q) AS title_q,
+               websearch_to_tsquery('simple', :q) AS name_q
+    ),
+    hits AS (
+        SELECT b.bookid, ts_rank(b.search_vector, q.title_q) + similarity(b.book_title, :q) AS score
+        FROM books b, q
+        WHERE b.search_vector @@ q.title_q OR b.book_title ILIKE :pattern
+        UNION ALL
+        SELECT ba.bookid, ts_rank(a.search_vector, q.name_q) + similarity(a.name, :q) AS score
+        FROM authors a
+        JOIN book_authors ba ON ba.authorid = a.authorid, q
+        WHERE a.search_vector @@ q.name_q OR a.name ILIKE :pattern
+    ),
+    ranked AS (
+        SELECT bookid, MAX(score) AS score
+        FROM hits
+        GROUP BY bookid
+        ORDER BY score DESC, bookid
+        LIMIT :limit OFFSET :offset
+    )
+    SELECT r.bookid, b.book_title, b.combined_rating,
+           string_agg(a.name, ', ' ORDER BY a.name) AS author_names, r.score
+    FROM ranked r
+    JOIN books b ON b.bookid = r.bookid
+    LEFT JOIN book_authors ba ON ba.bookid = b.bookid
+    LEFT JOIN authors a ON a.authorid = ba.authorid
+    GROUP BY r.bookid, b.book_title, b.combined_rating, r.score
+    ORDER BY r.score DESC, r.bookid
+""")
+
+SEARCH_INDEX_BOOKS = query("search_index_books", "SELECT bookid, book_title, combined_rating FROM books")
+
+SEARCH_INDEX_AUTHORS = query("search_index_authors", """
+    SELECT ba.bookid, a.name
+    FROM book_authors ba
+    JOIN authors a ON a.authorid = ba.authorid
+    ORDER BY a.name
+""")
+
+
+#
+# JSON API (/api/v1). Plain table rows in key order; BOOKS_FIRST and BOOKS_AFTER above
+# already are. The *_BY_IDS statements take a list of ids.
+#
+API_BOOKS_BY_IDS = query("api_books_by_ids", """
+    SELECT bookid, book_title, isbn, combined_rating FROM books
+    WHERE bookid IN :ids
+""", expanding=("ids",))
+
+API_AUTHORS_FIRST = query("api_authors_first", """
+    SELECT authorid, name, year_of_birth, nationality FROM authors
+    ORDER BY authorid
+    LIMIT :limit
+""")
+
+API_AUTHORS_AFTER = query("api_authors_after", """
+    SELECT authorid, name, year_of_birth, nationality FROM authors
+    WHERE authorid > :a0
+    ORDER BY authorid
+    LIMIT :limit
+""")
+
+API_AUTHORS_BY_IDS = query("api_authors_by_ids", """
+    SELECT authorid, name, year_of_birth, nationality FROM authors
+    WHERE authorid IN :ids
+""", expanding=("ids",))
+
+API_REVIEWS_FIRST = query("api_reviews_first", """
+    SELECT reviewid, userid, bookid, com_content, timestamp FROM reviews
+    ORDER BY reviewid
+    LIMIT :limit
+""")
+
+API_REVIEWS_AFTER = query("api_reviews_after", """
+    SELECT reviewid, userid, bookid, com_content, timestamp FROM reviews
+    WHERE reviewid > :a0
+    ORDER BY reviewid
+    LIMIT :limit
+""")
+
+API_REVIEWS_BY_IDS = query("api_reviews_by_ids", """
+    SELECT reviewid, userid, bookid, com_content, timestamp FROM reviews
+    WHERE reviewid IN :ids
+""", expanding=("ids",))
+
+API_COMMENTS_FIRST = query("api_comments_first", """
+    SELECT commentid, userid, reviewid, com_content, timestamp FROM comments
+    ORDER BY commentid
+    LIMIT :limit
+""")
+
+API_COMMENTS_AFTER = query("api_comments_after", """
+    SELECT commentid, userid, reviewid, com_content, timestamp FROM comments
+    WHERE commentid > :a0
+    ORDER BY commentid
+    LIMIT :limit
+""")
+
+API_COMMENTS_BY_IDS = query("api_comments_by_ids", """
+    SELECT commentid, userid, reviewid, com_content, timestamp FROM comments
+    WHERE commentid IN :ids
+""", expanding=("ids",))
+
+# ratings and favorites have no id of their own, they page by (userid, bookid)
+API_RATINGS_FIRST = query("api_ratings_first", """
+    SELECT userid, bookid, score FROM ratings
+    ORDER BY userid, bookid
+    LIMIT :limit
+""")
+
+API_RATINGS_AFTER = query("api_ratings_after", """
+    SELECT userid, bookid, score FROM ratings
+    WHERE (userid, bookid) > (:a0, :a1)
+    ORDER BY userid, bookid
+    LIMIT :limit
+""")
+
+API_FAVORITES_FIRST = query("api_favorites_first", """
+    SELECT userid, bookid FROM favorites
+    ORDER BY userid, bookid
+    LIMIT :limit
+""")
+
+API_FAVORITES_AFTER = query("api_favorites_after", """
+    SELECT userid, bookid FROM favorites
+    WHERE (userid, bookid) > (:a0, :a1)
+    ORDER BY userid, bookid
+    LIMIT :limit
+""")
+
+
+#
+# Recommendations (recommend.py): every (user, book) with the user's score and whether
+# it is one of their favorites.
+#
+RECOMMEND_INTERACTIONS = query("recommend_interactions", """
+    SELECT userid, bookid, MAX(score) AS score, MAX(favorite) AS favorite
+    FROM (
+        SELECT userid, bookid, score, 0 AS favorite FROM ratings
+        UNION ALL
+        SELECT userid, bookid, NULL, 1 FROM favorites
+    ) interactions
+    GROUP BY userid, bookid
+""")
+
+RECOMMEND_INTERACTIONS_OF_USERS = query("recommend_interactions_of_users", """
+    SELECT userid, bookid, MAX(score) AS score, MAX(favorite) AS favorite
+    FROM (
+        SELECT userid, bookid, score, 0 AS favorite FROM ratings WHERE userid IN :ids
+        UNION ALL
+        SELECT userid, bookid, NULL, 1 FROM favorites WHERE userid IN :ids
+    ) interactions
+    GROUP BY userid, bookid
+""", expanding=("ids",))
+
+
+#
+# Writes.
+#
+INSERT_BOOK = query("insert_book", """
+    INSERT INTO books (book_title, isbn, combined_rating)
+    VALUES (:title, :isbn, :rating)
+    RETURNING bookid
+""")
+
+INSERT_BOOK_AUTHOR = query("insert_book_author", """
+    INSERT INTO book_authors (bookid, authorid)
+    VALUES (:bookid, :authorid)
+""")
+
+INSERT_BOOK_GENRE = query("insert_book_genre", """
+    INSERT INTO bookgenres (bookid, genreid)
+    VALUES (:bookid, :genreid)
+""")
+
+INSERT_USER = query("insert_user", """
+    INSERT INTO users (username, user_email, preferences) VALUES (:username, :email, :preferences)
+""")
+
+INSERT_REVIEW = query("insert_review", """
+    INSERT INTO reviews (userid, bookid, com_content) VALUES (:user_id, :book_id, :content)
+    RETURNING reviewid
+""")
+
+# one statement, so two submissions at once can't both insert
+UPSERT_RATING = query("upsert_rating", """
+    INSERT INTO ratings (userid, bookid, score) VALUES (:uid, :bid, :score)
+    ON CONFLICT (userid, bookid) DO UPDATE SET score = EXCLUDED.score
+""")
+
+INSERT_COMMENT = query("insert_comment", """
+    INSERT INTO comments (userid, reviewid, com_content) VALUES (:user_id, :review_id, :com_content)
+""")
+
+# comments written later by the write-behind queue, with the time they were submitted
+# (epoch seconds) converted the way CURRENT_TIMESTAMP would have been
+INSERT_COMMENT_AT = query("insert_comment_at", """
+    INSERT INTO comments (userid, reviewid, com_content, timestamp)
+    VALUES (:user_id, :review_id, :com_content, CAST(to_timestamp(:submitted) AS timestamp))
+""")
+
+INSERT_COMMENT_AT_SQLITE = query("insert_comment_at_sqlite", """
+    INSERT INTO comments (userid, reviewid, com_content, timestamp)
+    VALUES (:user_id, :review_id, :com_content, datetime(:submitted, 'unixepoch'))
+""")
+
+# favoriting a book twice is a no-op
+INSERT_FAVORITE = query("insert_favorite", """
+    INSERT INTO favorites (userid, bookid) VALUES (:user_id, :book_id) ON CONFLICT DO NOTHING
+""")
+
+# nothing is inserted if the genre already exists (unique on lower(genrename))
+INSERT_GENRE = query("insert_genre", """
+    INSERT INTO genres (genrename) VALUES (:gname)
+    ON CONFLICT DO NOTHING
+    RETURNING genreid
+""")
+
+# nothing is inserted if the author already exists (unique on lower(name))
+INSERT_AUTHOR = query("insert_author", """
+    INSERT INTO authors (name, year_of_birth, nationality)
+    VALUES (:name, :year_of_birth, :nationality)
+    ON CONFLICT DO NOTHING
+    RETURNING authorid
+""")
+
+DELETE_BOOK = query("delete_book", "DELETE FROM books WHERE bookid = :bid")
+DELETE_AUTHOR = query("delete_author", "DELETE FROM authors WHERE authorid = :aid")
+DELETE_GENRE = query("delete_genre", "DELETE FROM genres WHERE genreid = :gid")
+
+# the userid makes sure only the author of a review, comment, ... can delete it
+DELETE_REVIEW = query("delete_review", """
+    DELETE FROM reviews WHERE reviewid = :rid AND userid = :uid
+    RETURNING reviewid
+""")
+
+DELETE_COMMENT = query("delete_comment", """
+    DELETE FROM comments WHERE commentid = :cid AND userid = :uid
+    RETURNING commentid
+""")
+
+DELETE_RATING = query("delete_rating", """
+    DELETE FROM ratings WHERE bookid = :bid AND userid = :uid
+    RETURNING bookid
+""")
+
+DELETE_FAVORITE = query("delete_favorite", """
+    DELETE FROM favorites WHERE bookid = :bid AND userid = :uid
+    RETURNING bookid
+""")
+
+
+#
+# Replica health checks.
+#
+# Seconds a Postgres replica is behind its primary. A replica that has replayed all the WAL
+# it received is caught up, however long ago the last transaction was.
+REPLICA_LAG = query("replica_lag", """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
@@ -0,0 +1,279 @@
+"""
+"Readers also liked" recommendations, from ratings and favorites. Needs numpy and scipy:
+
+    pip install numpy scipy
+
+Without them everything else works as before and there are simply no recommendations.
+
+Every user's interest in a book is one cell of a sparse user x book matrix X: score / 5 for
+a rating plus FAVORITE_WEIGHT for a favorite. Two books are similar when the same readers
+like them, measured by the cosine of their columns, i.e. G = X'X scaled by the column
+norms. Each book keeps its TOP_K most similar books, and each user gets the books most
+similar to the ones they already have, summed, leaving out the ones they have.
+
+The model is built in a background thread of each process and served from memory.
+note_change(user_id) after a rating or favorite queues the user; every
+INCREMENTAL_INTERVAL seconds the queued users' rows are read again and G is corrected by
+their difference. Only the similarities to the books in those rows change, so only those
+books and the books liked together with them get their similar books recomputed, and
+only the users who have one of these books their recommendations. Everything is rebuilt
+from scratch every REBUILD_INTERVAL seconds, which also brings in changes made by other
+processes.
+"""
+import logging
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+import queries
+
+TOP_K = 20
+PER_USER = 20
+FAVORITE_WEIGHT = 1.0
+INCREMENTAL_INTERVAL = 10
+REBUILD_INTERVAL = 3600
+
+log = logging.getLogger("bookhub.recommend")
+
+
+def top_k(matrix, k):
+    """
+    Keeps the k largest entries of every row of a sparse matrix, without a loop over the rows.
+    """
+    coo = matrix.tocoo()
+    # by row, and the largest first within a row
+    order = np.lexsort((-coo.data, coo.row))
+    rows = coo.row[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows, side="left")
+    keep = order[rank < k]
+    return sparse.csr_matrix((coo.data[keep], (coo.row[keep], coo.col[keep])), shape=matrix.shape)
+
+
+def replace_rows(matrix, rows, new_rows):
+    """
+    matrix with its rows `rows` (an index array) replaced by the rows of new_rows, in that order.
+    """
+    keep = np.ones(matrix.shape[0])
+    keep[rows] = 0
+    scatter = sparse.csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))),
+                                shape=(matrix.shape[0], len(rows)))
+    return (sparse.diags(keep) @ matrix + scatter @ new_rows).tocsr()
+
+
+def grow(matrix, shape):
+    matrix = matrix.tocsr(copy=True)
+    matrix.resize(shape)
+    return matrix
+
+
+class Model:
+    """
+    One build of the recommendations. Replaced as a whole, never changed once in use.
+      X: users x books interest, G: books x books X'X,
+      similar: books x books, the TOP_K similarities of every book,
+      for_user: users x books, the PER_USER recommendations of every user.
+    """
+
+    def __init__(self, user_ids, book_ids, X, G):
+        self.user_ids = user_ids
+        self.book_ids = book_ids
+        self.user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+        self.book_index = {book_id: i for i, book_id in enumerate(book_ids)}
+        self.X = X
+        self.G = G
+        self.similar = None
+        self.for_user = None
+        self.built_at = time.time()
+
+    def similarities(self, books):
+        """
+        Cosine similarities of the given books (rows) to every book.
+        """
+        norms = np.sqrt(self.G.diagonal())
+        inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        rows = (sparse.diags(inverse[books]) @ self.G[books] @ sparse.diags(inverse)).tocoo()
+        # a book isn't similar to itself
+        not_self = rows.col != np.asarray(books)[rows.row]
+        return sparse.csr_matrix((rows.data[not_self], (rows.row[not_self], rows.col[not_self])),
+                                 shape=rows.shape)
+
+    def recommendations(self, users):
+        """
+        PER_USER best books for the given users (rows), without the books they already have.
+        """
+        have = self.X[users]
+        scores = (have @ self.similar).tocsr()
+        owned = have.copy()
+        owned.data[:] = 1
+        scores = scores - scores.multiply(owned)
+        scores.eliminate_zeros()
+        return top_k(scores, PER_USER)
+
+    @staticmethod
+    def ranked(matrix, row, ids):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        cols, scores = matrix.indices[start:end], matrix.data[start:end]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(ids[col]), float(score)) for col, score in zip(cols[order], scores[order])]
+
+
+def interest_matrix(rows, user_index, book_index, shape):
+    users, books, values = [], [], []
+    for user_id, book_id, score, favorite in rows:
+        users.append(user_index[user_id])
+        books.append(book_index[book_id])
+        values.append((score or 0) / 5.0 + (FAVORITE_WEIGHT if favorite else 0.0))
+    return sparse.csr_matrix((values, (users, books)), shape=shape, dtype=np.float64)
+
+
+def build(conn):
+    rows = conn.execute(queries.RECOMMEND_INTERACTIONS).fetchall()
+    user_ids = sorted({row[0] for row in rows})
+    book_ids = sorted({row[1] for row in rows})
+    model = Model(user_ids, book_ids, None, None)
+    model.X = interest_matrix(rows, model.user_index, model.book_index, (len(user_ids), len(book_ids)))
+    model.G = (model.X.T @ model.X).tocsr()
+    model.similar = top_k(model.similarities(np.arange(len(book_ids))), TOP_K)
+    model.for_user = model.recommendations(np.arange(len(user_ids)))
+    return model
+
+
+def update(model, conn, user_ids):
+    """
+    Returns a new model with the rows of user_ids read again, see the module docstring.
+    """
+    rows = conn.execute(queries.RECOMMEND_INTERACTIONS_OF_USERS, {"ids": list(user_ids)}).fetchall()
+    new_users = [user_id for user_id in user_ids if user_id not in model.user_index]
+    new_books = sorted({row[1] for row in rows} - model.book_index.keys())
+    updated = Model(model.user_ids + new_users, model.book_ids + new_books, None, None)
+    shape = (len(updated.user_ids), len(updated.book_ids))
+    X = grow(model.X, shape)
+
+    users = np.array([updated.user_index[user_id] for user_id in user_ids])
+    old = X[users]
+    new = interest_matrix(rows, {user_id: i for i, user_id in enumerate(user_ids)}, updated.book_index,
+                          (len(users), shape[1]))
+    updated.X = replace_rows(X, users, new)
+    updated.G = (grow(model.G, (shape[1], shape[1])) + new.T @ new - old.T @ old).tocsr()
+
+    touched = np.union1d(old.indices, new.indices).astype(np.int64)
+    # the books that shared a reader with a touched book before or after the change
+    G = grow(model.G, updated.G.shape)
+    affected = np.union1d(touched, np.union1d(G[touched].indices, updated.G[touched].indices)).astype(np.int64)
+    similar = grow(model.similar, (shape[1], shape[1]))
+    updated.similar = replace_rows(similar, affected, top_k(updated.similarities(affected), TOP_K))
+    readers = np.union1d(users, updated.X.tocsc()[:, affected].indices).astype(np.int64)
+    for_user = grow(model.for_user, shape)
+    updated.for_user = replace_rows(for_user, readers, updated.recommendations(readers))
+    updated.built_at = model.built_at
+    return updated
+
+
+class Recommender:
+    """
+    The current Model of this process and the thread that keeps it up to date.
+    connect() returns a new database connection, for the thread.
+    """
+
+    def __init__(self, connect=None):
+        self.connect = connect
+        self.model = None
+        self.pending = set()
+        self.rebuild = False
+        self.lock = threading.Lock()
+        self.thread_pid = None
+        self.stop_event = threading.Event()
+        self.wake = threading.Event()
+
+    @property
+    def available(self):
+        return np is not None and self.connect is not None
+
+    def start(self):
+        # threads don't survive a fork, so every worker starts its own
+        if not self.available or self.thread_pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread_pid == os.getpid():
+                return
+            self.thread_pid = os.getpid()
+            self.stop_event = threading.Event()
+        threading.Thread(target=self.run, args=(self.stop_event,), name="recommender", daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+
+    def note_change(self, *user_ids):
+        """
+        Called after the ratings or favorites of user_ids changed.
+        """
+        if not self.available:
+            return
+        with self.lock:
+            self.pending.update(int(user_id) for user_id in user_ids)
+        self.start()
+
+    def rebuild_soon(self):
+        """
+        Called after a change too big to apply user by user (a deleted book).
+        """
+        self.rebuild = True
+        self.wake.set()
+
+    def run(self, stop):
+        while not stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("could not refresh the recommendations")
+            self.wake.wait(INCREMENTAL_INTERVAL)
+            self.wake.clear()
+
+    def refresh(self):
+        model = self.model
+        with self.lock:
+            pending, self.pending = self.pending, set()
+            rebuild, self.rebuild = self.rebuild, False
+        start = time.perf_counter()
+        with self.connect() as conn:
+            if rebuild or model is None or time.time() - model.built_at > REBUILD_INTERVAL:
+                self.model = build(conn)
+                log.info("built recommendations for %d users and %d books in %.2fs",
+                         len(self.model.user_ids), len(self.model.book_ids), time.perf_counter() - start)
+            elif pending:
+                self.model = update(model, conn, sorted(pending))
+                log.debug("updated recommendations of %d users in %.3fs", len(pending), time.perf_counter() - start)
+
+    def similar_books(self, book_ids, limit=10):
+        """
+        [(book id, score)] of the books most similar to book_ids together, not counting them.
+        """
+        self.start()
+        model = self.model
+        rows = [model.book_index[book_id] for book_id in book_ids if book_id in model.book_index] if model else []
+        if not rows:
+            return []
+        scores = np.asarray(model.similar[rows].sum(axis=0)).ravel()
+        scores[rows] = 0
+        best = np.argsort(-scores, kind="stable")[:limit]
+        return [(int(model.book_ids[i]), float(scores[i])) for i in best if scores[i] > 0]
+
+    def for_user(self, user_id, limit=PER_USER):
+        self.start()
+        model = self.model
+        if model is None or user_id not in model.user_index:
+            return []
+        return Model.ranked(model.for_user, model.user_index[user_id], model.book_ids)[:limit]
+
+    def stats(self):
+        model = self.model
+        if model is None:
+            return {"users": 0, "books": 0, "age": 0.0}
+        return {"users": len(model.user_ids), "books": len(model.book_ids), "age": time.time() - model.built_at}
@@ -0,0 +1,82 @@
+// Incremental lookup for the add_* forms.
+//
+// <input data-typeahead="/api/books" data-target="book_id" list="book_options"> asks the
+// server for matching rows as the user types, shows them in the datalist and puts the id
+// of the picked row into the hidden input named by data-target.
+//
+// <select data-reviews-for="book_id" data-source="/api/reviews"> is refilled with the
+// reviews of the book whenever the hidden book_id input changes.
+(function () {
+    var DELAY_MS = 150;
+
+    function setupTypeahead(input) {
+        var target = document.getElementById(input.dataset.target);
+        var list = document.getElementById(input.getAttribute("list"));
+        var ids = {};
+        var timer = null;
+        var lastPrefix = null;
+
+        // copies the id of the chosen suggestion into the hidden input
+        function pick() {
+            var id = ids[input.value];
+            var value = id === undefined ? "" : String(id);
+            input.setCustomValidity(value ? "" : "Pick one of the suggestions");
+            if (target.value !== value) {
+                target.value = value;
+                target.dispatchEvent(new Event("change"));
+            }
+        }
+
+        function fetchMatches() {
+            var prefix = input.value.trim();
+            if (!prefix || prefix === lastPrefix) {
+                return;
+            }
+            lastPrefix = prefix;
+            fetch(input.dataset.typeahead + "?prefix=" + encodeURIComponent(prefix))
+                .then(function (response) { return response.json(); })
+                .then(function (rows) {
+                    if (prefix !== lastPrefix) {
+                        return;  // the user kept typing, a newer request is on its way
+                    }
+                    list.innerHTML = "";
+                    rows.forEach(function (row) {
+                        // the id keeps rows with the same name apart
+                        var label = row.label + " (#" + row.id + ")";
+                        ids[label] = row.id;
+                        var option = document.createElement("option");
+                        option.value = label;
+                        list.appendChild(option);
+                    });
+                    pick();
+                });
+        }
+
+        input.addEventListener("input", function () {
+            pick();
+            clearTimeout(timer);
+            timer = setTimeout(fetchMatches, DELAY_MS);
+        });
+        pick();
+    }
+
+    function setupReviewSelect(select) {
+        var book = document.getElementById(select.dataset.reviewsFor);
+        book.addEventListener("change", function () {
+            select.innerHTML = "";
+            if (!book.value) {
+                return;
+            }
+            fetch(select.dataset.source + "?book=" + encodeURIComponent(book.value))
+                .then(function (response) { return response.json(); })
+                .then(function (rows) {
+                    rows.forEach(function (row) {
+                        select.add(new Option(row.label, row.id));
+                    });
+                });
+        });
+    }
+
+    document.querySelectorAll("[data-typeahead]").forEach(setupTypeahead);
+    document.querySelectorAll("[data-reviews-for]").forEach(setupReviewSelect);
+})();
@@ -0,0 +1,57 @@
+"""
+The write-behind queue (writebehind.py) against the routes of server.py, on a SQLite file.
+
+    python -m pytest -q test_write_behind.py
+"""
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import text
+
+directory = tempfile.mkdtemp()
+os.environ["BOOKHUB_DATABASE_URI"] = "sqlite:///" + os.path.join(directory, "bookhub.sqlite")
+os.environ["BOOKHUB_WRITE_BEHIND"] = "1"
+os.environ["BOOKHUB_WRITE_BEHIND_DIR"] = os.path.join(directory, "journal")
+
+import migrate  # noqa: E402
+import server  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client():
+    migrate.run_migrations(server.engine, report=lambda message: None)
+    with server.engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (userid, username) VALUES (1, 'reader')"))
+        conn.execute(text("INSERT INTO books (bookid, book_title) VALUES (1, 'Book 1'), (2, 'Book 2')"))
+    return server.app.test_client()
+
+
+def score(user_id, book_id):
+    with server.engine.connect() as conn:
+        return conn.execute(text("SELECT score FROM ratings WHERE userid = :u AND bookid = :b"),
+                            {"u": user_id, "b": book_id}).scalar()
+
+
+def test_api_rating_replaces_queued_rating(client):
+    client.post("/rate_book", data={"user_id": 1, "book_id": 1, "score": 2})
+    assert server.write_queue.stats()["pending"] == 1
+
+    response = client.post(f"{server.API_PREFIX}/ratings", json=[{"user_id": 1, "book_id": 1, "score": 5}])
+    assert response.status_code == 200
+    assert score(1, 1) == 5
+
+    server.write_queue.flush()
+    assert score(1, 1) == 5
+
+
+def test_failed_api_batch_keeps_queued_rating(client):
+    client.post("/rate_book", data={"user_id": 1, "book_id": 2, "score": 3})
+
+    # book 99 doesn't exist, so nothing of the batch is saved
+    response = client.post(f"{server.API_PREFIX}/ratings", json=[{"user_id": 1, "book_id": 2, "score": 4},
+                                                               {"user_id": 1, "book_id": 99, "score": 4}])
+    assert response.status_code == 400
+
+    server.write_queue.flush()
+    assert score(1, 2) == 3
@@ -0,0 +1,432 @@
+"""
+Write-behind queue for ratings, favorites and comments. Off by default; turn it on with
+BOOKHUB_WRITE_BEHIND=1 or `python server.py serve --write-behind`.
+
+When it is on, rate_book, add_favorite and add_comment don't write to the database. They
+append the change to a journal file, add it to the queue in memory and redirect at once.
+A thread in each process writes the queue to the database in one transaction when
+BATCH_SIZE changes are waiting, or every FLUSH_INTERVAL seconds. Changes to the same row
+are coalesced: only the last rating of a (user, book) is written, and a book favorited
+twice is inserted once. Until then the pages don't show the change. A comment keeps the
+time it was submitted as its timestamp.
+
+The queue is per process. Deleting a rating or favorite drops it from the queue of the
+process that serves the delete, but not from another process's, which would write it
+again afterwards. So the mode is only for a single server process: `serve` turns it off
+when it runs more than one worker, and under another WSGI server it must run one too.
+
+The journal is what makes a queued change survive a crash. Each change is appended and
+fsynced (FSYNC) before the route returns, to a file of the process in the journal
+directory. Each flush starts a new file and deletes the old ones once the transaction
+has committed. A process that starts reads the files left behind by processes that are
+no longer running and writes their changes too. When the process stops, whatever is
+queued is written before it exits (WriteBehind.stop(), a shutdown hook); what can't be
+written stays in the journal for the next start.
+
+A change the database refuses (a rating of a book deleted in the meantime) is logged
+and dropped, and the rest of the batch is written.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+import queries
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+# with this many changes queued (the database is slow or down) the routes write the
+# queue themselves, so it can't grow without bound
+MAX_PENDING = 50000
+FSYNC = True
+STOP_TIMEOUT = 30
+
+SEGMENT_RE = re.compile(r"^(\d+)-(\d+)\.journal$")
+
+log = logging.getLogger("bookhub.writebehind")
+
+
+def process_alive(pid):
+    if os.name != "posix":
+        # signal 0 only tests for the process on POSIX
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Batch:
+    """
+    Queued changes, coalesced. Records are the lines of the journal:
+      ["rating", user id, book id, score]      ["unrate", user id, book id]
+      ["favorite", user id, book id]           ["unfavorite", user id, book id]
+      ["comment", user id, review id, content, submitted (epoch seconds)]
+    """
+
+    def __init__(self):
+        self.ratings = {}       # (user id, book id) -> score
+        self.favorites = {}     # (user id, book id) -> None, a set that keeps the order
+        self.comments = []      # (user id, review id, content, submitted)
+        self.started = None
+
+    def __len__(self):
+        return len(self.ratings) + len(self.favorites) + len(self.comments)
+
+    def apply(self, record):
+        kind, *values = record
+        if kind == "rating":
+            user_id, book_id, score = values
+            self.ratings.pop((user_id, book_id), None)
+            self.ratings[(user_id, book_id)] = score
+        elif kind == "unrate":
+            self.ratings.pop(tuple(values), None)
+        elif kind == "favorite":
+            self.favorites[tuple(values)] = None
+        elif kind == "unfavorite":
+            self.favorites.pop(tuple(values), None)
+        elif kind == "comment":
+            self.comments.append(tuple(values))
+        else:
+            raise ValueError(f"unknown journal record {kind!r}")
+        if self.started is None:
+            self.started = time.time()
+
+    def update(self, newer):
+        """
+        Adds the changes of a batch queued after this one.
+        """
+        for key, score in newer.ratings.items():
+            self.ratings.pop(key, None)
+            self.ratings[key] = score
+        self.favorites.update(newer.favorites)
+        self.comments.extend(newer.comments)
+        if self.started is None:
+            self.started = newer.started
+
+    def statements(self, dialect):
+        """
+        [(statement, [params])] that write the batch.
+        """
+        statements = []
+        if self.ratings:
+            statements.append((queries.UPSERT_RATING, [{"uid": user_id, "bid": book_id, "score": score}
+                                                       for (user_id, book_id), score in self.ratings.items()]))
+        if self.favorites:
+            statements.append((queries.INSERT_FAVORITE, [{"user_id": user_id, "book_id": book_id}
+                                                         for user_id, book_id in self.favorites]))
+        if self.comments:
+            insert_comment = queries.INSERT_COMMENT_AT_SQLITE if dialect == "sqlite" else queries.INSERT_COMMENT_AT
+            statements.append((insert_comment, [{"user_id": user_id, "review_id": review_id, "com_content": content,
+                                                 "submitted": submitted}
+                                                for user_id, review_id, content, submitted in self.comments]))
+        return statements
+
+    def tables(self):
+        return [table for table, rows in (("ratings", self.ratings), ("favorites", self.favorites),
+                                          ("comments", self.comments)) if rows]
+
+    def user_ids(self):
+        """
+        The users whose ratings or favorites are in the batch.
+        """
+        return {user_id for user_id, _ in self.ratings} | {user_id for user_id, _ in self.favorites}
+
+
+class WriteBehind:
+    """
+    The queue of this process, its journal and the thread that writes it.
+    connect() returns a new database connection, for the thread. on_flush(batch) is called
+    after a batch has been committed.
+    """
+
+    def __init__(self, connect, directory, on_flush=None, enabled=False):
+        self.connect = connect
+        self.directory = directory
+        self.on_flush = on_flush
+        self.enabled = enabled
+        # pending, segments and the journal
+        self.lock = threading.Lock()
+        # one flush at a time; held from taking the batch until it is committed
+        self.flush_lock = threading.Lock()
+        # one fsync of the journal at a time, see sync()
+        self.sync_lock = threading.Lock()
+        self.appended = 0
+        self.synced = 0
+        self.pending = Batch()
+        # journal files whose records are all in pending, oldest first
+        self.segments = []
+        self.journal = None
+        self.seq = 0
+        self.pid = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.wake = threading.Event()
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_seconds = 0.0
+
+    def start(self):
+        # threads and open files don't survive a fork, so every worker starts its own
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            # whatever a parent process had queued is its own to write
+            self.pending = Batch()
+            self.segments = []
+            self.journal = None
+            os.makedirs(self.directory, exist_ok=True)
+            self.recover()
+            self.journal = self.new_segment()
+            self.stop_event = threading.Event()
+            self.thread = threading.Thread(target=self.run, args=(self.stop_event,), name="write-behind",
+                                           daemon=True)
+        self.thread.start()
+
+    def new_segment(self):
+        self.seq += 1
+        return open(os.path.join(self.directory, f"{self.pid}-{self.seq}.journal"), "a", encoding="utf-8")
+
+    def recover(self):
+        """
+        Queues the changes in the journal files of processes that are gone (or of an
+        earlier process with this pid), oldest first.
+        """
+        found = []
+        for filename in os.listdir(self.directory):
+            match = SEGMENT_RE.match(filename)
+            if match:
+                pid, seq = int(match.group(1)), int(match.group(2))
+                if pid == self.pid or not process_alive(pid):
+                    found.append((pid, seq, filename))
+        # the claimed files are numbered after the ones of this pid, so none is overwritten
+        self.seq = max([seq for pid, seq, _ in found if pid == self.pid], default=0)
+        recovered = 0
+        for _, _, filename in sorted(found):
+            self.seq += 1
+            path = os.path.join(self.directory, f"{self.pid}-{self.seq}.journal")
+            try:
+                # the rename claims the file, only one process can succeed
+                os.rename(os.path.join(self.directory, filename), path)
+            except FileNotFoundError:
+                continue
+            with open(path, encoding="utf-8") as lines:
+                for line in lines:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the last line of a process that died while writing it
+                        continue
+                    self.pending.apply(record)
+                    recovered += 1
+            self.segments.append(path)
+        if recovered:
+            log.info("recovered %d queued writes from %d journal files", recovered, len(self.segments))
+            self.wake.set()
+
+    def put(self, record):
+        self.start()
+        with self.lock:
+            appended = self.append(record)
+            self.pending.apply(record)
+            depth = len(self.pending)
+        self.sync(appended)
+        if depth >= MAX_PENDING:
+            self.flush()
+        elif depth >= BATCH_SIZE:
+            self.wake.set()
+
+    def append(self, record):
+        """
+        Writes record to the journal, called with lock held. Returns its number for sync().
+        """
+        self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+        self.appended += 1
+        return self.appended
+
+    def sync(self, appended):
+        """
+        Returns once the journal is on disk up to record number appended. Called without
+        lock, so the requests that append while one fsync runs share the next one.
+        """
+        if not FSYNC:
+            return
+        with self.sync_lock:
+            if self.synced >= appended:
+                return
+            # take() can't start a new file while sync_lock is held
+            upto = self.appended
+            os.fsync(self.journal.fileno())
+            self.synced = upto
+
+    def rate(self, user_id, book_id, score):
+        self.put(["rating", int(user_id), int(book_id), int(score)])
+
+    def favorite(self, user_id, book_id):
+        self.put(["favorite", int(user_id), int(book_id)])
+
+    def comment(self, user_id, review_id, content):
+        self.put(["comment", int(user_id), int(review_id), content, time.time()])
+
+    def discard_rating(self, user_id, book_id):
+        """
+        Drops a queued rating, before the rating is deleted from the database. Waits
+        for a flush in progress, which may be writing it.
+        """
+        self.discard(["unrate", int(user_id), int(book_id)])
+
+    def discard_ratings(self, keys):
+        """
+        Drops the queued ratings of (user id, book id) keys, before they are written to the
+        database another way. Returns {(user id, book id): score} of the ones dropped.
+        """
+        return self.discard(*(["unrate", int(user_id), int(book_id)] for user_id, book_id in keys))
+
+    def discard_favorite(self, user_id, book_id):
+        self.discard(["unfavorite", int(user_id), int(book_id)])
+
+    def discard(self, *records):
+        dropped = {}
+        if self.pid != os.getpid():
+            return dropped
+        appended = 0
+        with self.flush_lock, self.lock:
+            for record in records:
+                queued = self.pending.ratings if record[0] == "unrate" else self.pending.favorites
+                key = tuple(record[1:])
+                if key not in queued:
+                    continue
+                dropped[key] = queued[key]
+                appended = self.append(record)
+                self.pending.apply(record)
+        if appended:
+            self.sync(appended)
+        return dropped
+
+    def take(self):
+        """
+        Swaps pending for an empty batch and starts a new journal file. Returns the
+        batch and the journal files it was read from.
+        """
+        with self.lock:
+            if not self.pending and not self.segments:
+                return None, []
+            batch, self.pending = self.pending, Batch()
+            with self.sync_lock:
+                if FSYNC and self.synced < self.appended:
+                    os.fsync(self.journal.fileno())
+                self.synced = self.appended
+                self.journal.close()
+            segments, self.segments = self.segments + [self.journal.name], []
+            self.journal = self.new_segment()
+            return batch, segments
+
+    def flush(self):
+        """
+        Writes everything queued so far. Returns the number of changes written.
+        """
+        with self.flush_lock:
+            batch, segments = self.take()
+            if batch is None:
+                return 0
+            start = time.perf_counter()
+            dropped = 0
+            try:
+                if batch:
+                    dropped = self.write(batch)
+            except Exception:
+                # queued again, in front of what came in meanwhile; the journal files stay
+                with self.lock:
+                    batch.update(self.pending)
+                    self.pending = batch
+                    self.segments = segments + self.segments
+                self.failures += 1
+                raise
+            self.last_flush_seconds = time.perf_counter() - start
+            self.written += len(batch) - dropped
+            self.batches += 1
+            for path in segments:
+                os.remove(path)
+        log.debug("wrote %d queued writes in %.3fs", len(batch), self.last_flush_seconds)
+        if batch and self.on_flush is not None:
+            self.on_flush(batch)
+        return len(batch)
+
+    def write(self, batch):
+        """
+        Writes batch in one transaction. Returns the number of changes dropped.
+        """
+        dropped = 0
+        with self.connect() as conn:
+            statements = batch.statements(conn.dialect.name)
+            try:
+                for statement, params in statements:
+                    conn.execute(statement, params)
+                conn.commit()
+                return dropped
+            except IntegrityError:
+                conn.rollback()
+
+            # one bad row fails the whole batch, and would again every time: write them
+            # one by one and drop the ones the database refuses
+            for statement, params in statements:
+                for row in params:
+                    try:
+                        conn.execute(statement, row)
+                        conn.commit()
+                    except IntegrityError as e:
+                        conn.rollback()
+                        dropped += 1
+                        log.warning("dropped queued write %s: %s", row, e.orig)
+        self.dropped += dropped
+        return dropped
+
+    def run(self, stop):
+        while True:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            stopping = stop.is_set()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("could not write %d queued writes, will retry", len(self.pending))
+                if not stopping:
+                    stop.wait(FLUSH_INTERVAL)
+            if stopping:
+                return
+
+    def stop(self):
+        """
+        Writes what is queued and stops the thread. Called when the process shuts down.
+        """
+        if self.pid != os.getpid() or self.thread is None:
+            return
+        self.stop_event.set()
+        self.wake.set()
+        self.thread.join(STOP_TIMEOUT)
+        with self.lock, self.sync_lock:
+            self.journal.close()
+            if self.pending:
+                log.warning("%d queued writes left in the journal in %s", len(self.pending), self.directory)
+            else:
+                os.remove(self.journal.name)
+            self.pid = None
+
+    def stats(self):
+        pending = self.pending
+        return {"pending": len(pending), "oldest": time.time() - pending.started if pending else 0.0,
+                "written": self.written, "batches": self.batches, "failures": self.failures,
+                "dropped": self.dropped, "last_flush_seconds": self.last_flush_seconds}